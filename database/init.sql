@@ -25,69 +25,327 @@ CREATE TABLE IF NOT EXISTS weather (
     day_of_week_int INTEGER
 );
 
+-- Rounds and bookings are partitioned by season (calendar year) on round_date / tee_time.
+-- needs PostgreSQL 13+ (BEFORE ROW triggers on partitioned tables)
+
+-- older installs have plain rounds/bookings tables - rename them (and their sequences and
+-- indexes) out of the way so the partitioned tables can be created, the rows are copied below.
+-- round_date is the partition key and can't be NULL, so stop before anything is renamed if old
+-- rounds have no date - fix or delete those rows, then run this file again
+DO $$
+DECLARE
+    old_table TEXT;
+    old_sequence TEXT;
+    old_index RECORD;
+    undated_rounds BIGINT;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('rounds') AND relkind = 'r') THEN
+        EXECUTE 'SELECT COUNT(*) FROM rounds WHERE round_date IS NULL' INTO undated_rounds;
+        IF undated_rounds > 0 THEN
+            RAISE EXCEPTION 'Cannot partition rounds: % rounds have no round_date', undated_rounds
+                USING HINT = 'Set or delete them (SELECT * FROM rounds WHERE round_date IS NULL), then rerun init.sql';
+        END IF;
+    END IF;
+
+    FOREACH old_table IN ARRAY ARRAY['rounds', 'bookings'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass(old_table) AND relkind = 'r') THEN
+            old_sequence := pg_get_serial_sequence(old_table, CASE old_table WHEN 'rounds' THEN 'round_id' ELSE 'booking_id' END);
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', old_table, old_table || '_unpartitioned');
+            EXECUTE format('ALTER SEQUENCE %s RENAME TO %I', old_sequence, old_table || '_unpartitioned_seq');
+            FOR old_index IN
+                SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = to_regclass(old_table || '_unpartitioned')
+            LOOP
+                EXECUTE format('ALTER INDEX %I RENAME TO %I', old_index.relname, old_index.relname || '_unpartitioned');
+            END LOOP;
+        END IF;
+    END LOOP;
+END;
+$$;
+
 -- Rounds table
 CREATE TABLE IF NOT EXISTS rounds (
-    round_id SERIAL PRIMARY KEY,
+    round_id SERIAL,
     player_id INTEGER REFERENCES players(player_id),
     player_name VARCHAR(100) NOT NULL,
-    round_date DATE REFERENCES weather(date),
+    round_date DATE NOT NULL REFERENCES weather(date),
     score INTEGER NOT NULL,
-    round_number INTEGER
-);
+    round_number INTEGER,
+    round_index SMALLINT, -- which round of the raw row (Open.R1 to R4) - round_number is renumbered by date
+    source_file VARCHAR(255), -- raw file the round was loaded from
+    source_key BIGINT, -- xxhash64 of the raw row, same in the spark and pandas engines
+    PRIMARY KEY (round_id, round_date) -- partition key has to be part of the key
+) PARTITION BY RANGE (round_date);
+
+-- natural key columns for installs created before they existed (added to every partition)
+ALTER TABLE rounds ADD COLUMN IF NOT EXISTS round_index SMALLINT;
+ALTER TABLE rounds ADD COLUMN IF NOT EXISTS source_file VARCHAR(255);
+ALTER TABLE rounds ADD COLUMN IF NOT EXISTS source_key BIGINT;
 
 -- Bookings table
 CREATE TABLE IF NOT EXISTS bookings (
-    booking_id SERIAL PRIMARY KEY,
+    booking_id SERIAL,
     player_id INTEGER REFERENCES players(player_id),
     tee_time TIMESTAMP NOT NULL,
     price_paid FLOAT NOT NULL DEFAULT 75,
     booking_status VARCHAR(20) DEFAULT 'confirmed',
     round_date DATE NOT NULL,
     score_prediction FLOAT DEFAULT NULL,
-    booking_time TIMESTAMP NOT NULL
+    booking_time TIMESTAMP NOT NULL,
+    PRIMARY KEY (booking_id, tee_time)
+) PARTITION BY RANGE (tee_time);
+
+-- rows outside every season partition land here, so inserts never fail for a missing season
+CREATE TABLE IF NOT EXISTS rounds_default PARTITION OF rounds DEFAULT;
+CREATE TABLE IF NOT EXISTS bookings_default PARTITION OF bookings DEFAULT;
+
+-- create one season's partition of rounds or bookings - returns false if it already exists.
+-- rows already sitting in the default partition for that season are moved into it
+CREATE OR REPLACE FUNCTION create_season_partition(parent TEXT, season INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    key_column TEXT := CASE parent WHEN 'rounds' THEN 'round_date' WHEN 'bookings' THEN 'tee_time' END;
+    partition_name TEXT := format('%s_%s', parent, season);
+    season_start DATE := make_date(season, 1, 1);
+    season_end DATE := make_date(season + 1, 1, 1);
+BEGIN
+    IF key_column IS NULL THEN
+        RAISE EXCEPTION 'No season partitioning for table %', parent;
+    END IF;
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    -- built detached then attached, so moving rows doesn't run the row triggers again
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+        parent || '_default', key_column, season_start, key_column, season_end, partition_name
+    );
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition_name, season_start, season_end);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- create rounds and bookings partitions for every season in a range - returns how many were new
+CREATE OR REPLACE FUNCTION create_season_partitions(first_season INTEGER, last_season INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    season INTEGER;
+    created INTEGER := 0;
+BEGIN
+    FOR season IN first_season..last_season LOOP
+        IF create_season_partition('rounds', season) THEN created := created + 1; END IF;
+        IF create_season_partition('bookings', season) THEN created := created + 1; END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- seasons covered by the raw data through next season - scripts/manage_partitions.py adds later ones
+SELECT create_season_partitions(2013, EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER + 1);
+
+-- copy rows from tables renamed above. no triggers exist on the new tables yet, so scores
+-- aren't adjusted twice - the summaries and handicap state are rebuilt at the end of this file
+DO $$
+BEGIN
+    IF to_regclass('rounds_unpartitioned') IS NOT NULL THEN
+        INSERT INTO rounds (round_id, player_id, player_name, round_date, score, round_number)
+        SELECT round_id, player_id, player_name, round_date, score, round_number
+        FROM rounds_unpartitioned; -- undated rounds were ruled out before the rename
+        PERFORM setval(pg_get_serial_sequence('rounds', 'round_id'),
+                       (SELECT COALESCE(MAX(round_id), 0) + 1 FROM rounds_unpartitioned), false);
+        DROP TABLE rounds_unpartitioned;
+    END IF;
+
+    IF to_regclass('bookings_unpartitioned') IS NOT NULL THEN
+        INSERT INTO bookings (booking_id, player_id, tee_time, price_paid, booking_status, round_date, score_prediction, booking_time)
+        SELECT booking_id, player_id, tee_time, price_paid, booking_status, round_date, score_prediction, booking_time
+        FROM bookings_unpartitioned;
+        PERFORM setval(pg_get_serial_sequence('bookings', 'booking_id'),
+                       (SELECT COALESCE(MAX(booking_id), 0) + 1 FROM bookings_unpartitioned), false);
+        DROP TABLE bookings_unpartitioned;
+    END IF;
+END;
+$$;
+
+-- Tee time inventory - one row per tee time, created by its first booking
+-- booked counts confirmed players and can never pass capacity (4 = foursome)
+CREATE TABLE IF NOT EXISTS tee_time_slots (
+    slot_time TIMESTAMP PRIMARY KEY,
+    capacity SMALLINT NOT NULL DEFAULT 4,
+    booked SMALLINT NOT NULL DEFAULT 0,
+    CHECK (booked >= 0 AND booked <= capacity)
 );
 
+-- slots for bookings made before the inventory existed
+INSERT INTO tee_time_slots (slot_time, capacity, booked)
+SELECT tee_time, GREATEST(4, COUNT(*)), COUNT(*)
+FROM bookings
+WHERE booking_status = 'confirmed'
+GROUP BY tee_time
+ON CONFLICT (slot_time) DO NOTHING;
+
 -- indexes for performance
 CREATE INDEX IF NOT EXISTS idx_players_name ON players(player_name);
 CREATE INDEX IF NOT EXISTS idx_weather_date ON weather(date);
 CREATE INDEX IF NOT EXISTS idx_rounds_player_round ON rounds(player_id, round_number);
+-- created on every partition, including ones attached later
+-- btree on round_date for date range reports across players (within the pruned season partitions),
+-- and on (player_id, round_date) for a player's history by date.
+-- no BRIN on round_date - the ETL spreads a file's rounds over the seasons by hash, so rows
+-- land in random date order and block ranges would all overlap
+DROP INDEX IF EXISTS idx_rounds_date_brin;
+CREATE INDEX IF NOT EXISTS idx_rounds_date ON rounds(round_date);
+CREATE INDEX IF NOT EXISTS idx_rounds_player_date ON rounds(player_id, round_date);
+-- natural key of a loaded round - the ETL merges with ON CONFLICT DO NOTHING on it, so reloading
+-- a file only inserts rounds not already there and the triggers only see those.
+-- a corrected score changes the key, so changed files also go through remove_replaced_rounds() below.
+-- includes round_date because unique keys on a partitioned table must contain the partition key.
+-- rounds loaded before these columns existed would never conflict - the migration at the end of
+-- this file removes them so the pipeline can reload them under the key
+CREATE UNIQUE INDEX IF NOT EXISTS idx_rounds_natural_key
+    ON rounds(player_id, round_date, round_index, source_file, source_key);
+-- btree on tee_time for availability lookups on a day or a single tee time
+CREATE INDEX IF NOT EXISTS idx_bookings_tee_time ON bookings(tee_time);
+CREATE INDEX IF NOT EXISTS idx_bookings_player ON bookings(player_id);
 
 -- Triggers and Functions
+-- player stats and round numbers are maintained by statement level triggers.
+-- new_rounds holds every row inserted by the statement, so a bulk load of
+-- thousands of rounds does the work once per affected player instead of once per row
+
+-- drop per row triggers from older installs before replacing them
+DROP TRIGGER IF EXISTS update_player_stats_trigger ON rounds;
+DROP TRIGGER IF EXISTS trigger_assign_round_numbers ON rounds;
+
+-- Rolling handicap state
+-- the 20 most recent differentials per player (by round_date, then round_id) with their sum.
+-- new rounds are merged into the stored window, so an insert never re-sorts the player's history
+CREATE TABLE IF NOT EXISTS player_handicap_state (
+    player_id INTEGER PRIMARY KEY REFERENCES players(player_id),
+    round_dates DATE[] NOT NULL, -- window, newest first
+    round_ids INTEGER[] NOT NULL,
+    differentials NUMERIC[] NOT NULL,
+    differential_sum NUMERIC NOT NULL
+);
+
+-- differential for one score, same rounding as calculate_handicap_for_player
+CREATE OR REPLACE FUNCTION score_differential(score INTEGER)
+RETURNS NUMERIC AS $$
+    SELECT ROUND(((score - 67.3) * 113.0 / 119.0)::NUMERIC, 1);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- handicap from a window's sum and size - averaged through FLOAT like calculate_handicap_for_player
+CREATE OR REPLACE FUNCTION handicap_from_window(differential_sum NUMERIC, window_size INTEGER)
+RETURNS FLOAT AS $$
+    SELECT CASE
+        WHEN window_size IS NULL OR window_size = 0 THEN NULL
+        ELSE ROUND(((differential_sum / window_size)::FLOAT)::NUMERIC * 0.96, 1)::FLOAT
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- lock the players a statement inserted rounds for, in player_id order, before any other
+-- statement trigger writes. statement triggers fire in name order, so the trigger's name sorts
+-- before trigger_add_rounds_to_summaries, trigger_assign_round_numbers and update_player_stats_trigger.
+-- a concurrent load for the same players waits here until the other commits.
+-- NO KEY UPDATE because the insert already holds KEY SHARE on these rows for the foreign key
+CREATE OR REPLACE FUNCTION lock_round_players()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM 1
+    FROM players
+    WHERE player_id IN (SELECT DISTINCT player_id FROM new_rounds)
+    ORDER BY player_id
+    FOR NO KEY UPDATE;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS lock_players_for_new_rounds ON rounds;
+CREATE TRIGGER lock_players_for_new_rounds
+    AFTER INSERT ON rounds
+    REFERENCING NEW TABLE AS new_rounds
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION lock_round_players();
+
 CREATE OR REPLACE FUNCTION update_player_stats()
 RETURNS TRIGGER AS $$
 BEGIN
-    -- update rounds_played count for each player
-    UPDATE players
-    SET rounds_played = (
-        SELECT COUNT(*)
-        FROM rounds
-        WHERE player_id = NEW.player_id
+    -- the affected players were locked by lock_players_for_new_rounds, which fires first. this
+    -- merge is a later statement, so under READ COMMITTED it reads the window a concurrent load
+    -- for the same player committed instead of both merging into the same old window.
+    -- merge each affected player's new rounds into their stored window and keep the newest 20.
+    -- work per player is the window plus the new rounds, not their whole history
+    WITH affected AS (
+        SELECT DISTINCT player_id
+        FROM new_rounds
+        WHERE player_id IS NOT NULL
+    ),
+    candidates AS (
+        SELECT s.player_id, w.round_date, w.round_id, w.differential
+        FROM player_handicap_state s
+        JOIN affected a ON a.player_id = s.player_id
+        CROSS JOIN LATERAL unnest(s.round_dates, s.round_ids, s.differentials) AS w(round_date, round_id, differential)
+        UNION ALL
+        SELECT player_id, round_date, round_id, score_differential(score)
+        FROM new_rounds
+        WHERE player_id IS NOT NULL
+    ),
+    ranked AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY round_date DESC, round_id DESC) AS rn
+        FROM candidates
     )
-    WHERE player_id = NEW.player_id;
+    INSERT INTO player_handicap_state AS s (player_id, round_dates, round_ids, differentials, differential_sum)
+    SELECT player_id,
+           array_agg(round_date ORDER BY rn),
+           array_agg(round_id ORDER BY rn),
+           array_agg(differential ORDER BY rn),
+           SUM(differential)
+    FROM ranked
+    WHERE rn <= 20
+    GROUP BY player_id
+    ON CONFLICT (player_id) DO UPDATE
+    SET round_dates = EXCLUDED.round_dates,
+        round_ids = EXCLUDED.round_ids,
+        differentials = EXCLUDED.differentials,
+        differential_sum = EXCLUDED.differential_sum;
 
-    -- member status update if they've played 30+ rounds
-    UPDATE players
-    SET member_status = 'member'
-    WHERE player_id = NEW.player_id
-    AND (SELECT COUNT(*) FROM rounds WHERE player_id = NEW.player_id) >= 30
-    AND member_status = 'guest';
-
-    -- update handicap (calculate from past 20 rounds)
-	UPDATE players
-    SET handicap = calculate_handicap_for_player(NEW.player_id)
-    WHERE player_id = NEW.player_id;
+    -- update rounds_played count, member status and handicap for each affected player
+    WITH new_counts AS (
+        SELECT player_id, COUNT(*) AS new_round_count
+        FROM new_rounds
+        WHERE player_id IS NOT NULL
+        GROUP BY player_id
+    )
+    UPDATE players p
+    SET rounds_played = COALESCE(p.rounds_played, 0) + nc.new_round_count,
+        -- member status update if they've played 30+ rounds
+        member_status = CASE
+            WHEN COALESCE(p.rounds_played, 0) + nc.new_round_count >= 30 AND p.member_status = 'guest' THEN 'member'
+            ELSE p.member_status
+        END,
+        -- handicap from the last 20 rounds, read from the rolling state
+        handicap = handicap_from_window(s.differential_sum, cardinality(s.differentials))
+    FROM new_counts nc
+    JOIN player_handicap_state s ON s.player_id = nc.player_id
+    WHERE p.player_id = nc.player_id;
 
-    RETURN NEW;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
 -- trigger to update player stats when rounds are inserted
 CREATE TRIGGER update_player_stats_trigger
     AFTER INSERT ON rounds
-    FOR EACH ROW
+    REFERENCING NEW TABLE AS new_rounds
+    FOR EACH STATEMENT
     EXECUTE FUNCTION update_player_stats();
 
--- function to calculate handicap for a specific player
+-- function to calculate handicap for a specific player from their full history
+-- the trigger uses the rolling state instead, this is the reference verify_handicap_state checks against
 CREATE OR REPLACE FUNCTION calculate_handicap_for_player(p_player_id INTEGER)
 RETURNS FLOAT AS $$
 DECLARE
@@ -110,7 +368,7 @@ BEGIN
         SELECT score
         FROM rounds
         WHERE player_id = p_player_id
-        ORDER BY round_date DESC
+        ORDER BY round_date DESC, round_id DESC -- round_id breaks ties the same way as the rolling state
         LIMIT 20
     ) recent_scores;
 
@@ -120,21 +378,30 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- Function to assign round numbers based on dates of rounds
-CREATE OR REPLACE FUNCTION assign_round_numbers()
-RETURNS TRIGGER AS $$
-BEGIN
-    -- update round_number for all rounds of this player ordered by round_date
+-- number a set of players' rounds 1..n by round_date (round_id breaks ties)
+CREATE OR REPLACE FUNCTION renumber_rounds(p_player_ids INTEGER[])
+RETURNS VOID AS $$
     WITH ordered_rounds AS (
-        SELECT round_id,
-               ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY round_date ASC) AS rn
-        FROM rounds
-        WHERE player_id = NEW.player_id
+        SELECT r.round_id, r.round_date,
+               ROW_NUMBER() OVER (PARTITION BY r.player_id ORDER BY r.round_date ASC, r.round_id ASC) AS rn
+        FROM rounds r
+        WHERE r.player_id = ANY(p_player_ids)
     )
     UPDATE rounds
     SET round_number = ordered_rounds.rn
     FROM ordered_rounds
-    WHERE rounds.round_id = ordered_rounds.round_id;
+    -- match the full primary key (round_id, round_date) so each row is found in its own season partition
+    WHERE rounds.round_id = ordered_rounds.round_id
+    AND rounds.round_date = ordered_rounds.round_date
+    AND rounds.round_number IS DISTINCT FROM ordered_rounds.rn; -- skip rows already numbered correctly
+$$ LANGUAGE sql;
+
+-- Function to assign round numbers based on dates of rounds
+CREATE OR REPLACE FUNCTION assign_round_numbers()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- update round_number for all rounds of each affected player ordered by round_date
+    PERFORM renumber_rounds(ARRAY(SELECT DISTINCT player_id FROM new_rounds WHERE player_id IS NOT NULL));
 
     RETURN NULL;
 END;
@@ -143,7 +410,8 @@ $$ LANGUAGE plpgsql;
 -- Trigger to assign round numbers on insert
 CREATE TRIGGER trigger_assign_round_numbers
 AFTER INSERT ON rounds
-FOR EACH ROW
+REFERENCING NEW TABLE AS new_rounds
+FOR EACH STATEMENT
 EXECUTE FUNCTION assign_round_numbers();
 
 -- Function for adjusting scores
@@ -205,7 +473,285 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- trigger to activate adjust score function on record insert
+-- stays per row since it rewrites NEW.score, but only a single weather lookup by primary key.
+-- limited to score/date updates so renumbering rounds doesn't adjust scores a second time
+DROP TRIGGER IF EXISTS trigger_adjust_score ON rounds;
 CREATE TRIGGER trigger_adjust_score
-    BEFORE INSERT OR UPDATE ON rounds
+    BEFORE INSERT OR UPDATE OF score, round_date ON rounds
     FOR EACH ROW
-    EXECUTE FUNCTION adjust_score_for_round();
\ No newline at end of file
+    EXECUTE FUNCTION adjust_score_for_round();
+-- Analytics summaries
+-- running totals behind the reports in queries.sql, so reports read a few summary
+-- rows instead of scanning rounds. Inserts are added incrementally by a statement
+-- level trigger. Averages are score_sum / rounds_played at read time.
+-- Updates or deletes of rounds (and weather edits) need refresh_analytics_summaries()
+
+-- report categories, shared by the trigger and the full refresh
+CREATE OR REPLACE FUNCTION weather_category(precipitation FLOAT, wind_speed FLOAT, avg_temp FLOAT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN precipitation > 0.5 THEN 'Rainy'
+        WHEN wind_speed > 15 THEN 'Windy'
+        WHEN avg_temp < 45 OR avg_temp > 95 THEN 'Extreme Weather'
+        ELSE 'Good Conditions'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION playing_conditions(precipitation FLOAT, wind_speed FLOAT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN precipitation > 0.5 THEN 'Rainy'
+        WHEN wind_speed > 15 THEN 'Windy'
+        ELSE 'Good Conditions'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS player_round_summary (
+    player_id INTEGER PRIMARY KEY REFERENCES players(player_id),
+    rounds_played BIGINT NOT NULL,
+    score_sum BIGINT NOT NULL,
+    best_score INTEGER,
+    worst_score INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS weather_impact_summary (
+    weather_category TEXT PRIMARY KEY,
+    rounds_played BIGINT NOT NULL,
+    score_sum BIGINT NOT NULL,
+    best_score INTEGER,
+    worst_score INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS monthly_round_summary (
+    year INTEGER,
+    month INTEGER,
+    rounds_played BIGINT NOT NULL,
+    score_sum BIGINT NOT NULL,
+    PRIMARY KEY (year, month)
+);
+
+CREATE TABLE IF NOT EXISTS player_conditions_summary (
+    player_id INTEGER REFERENCES players(player_id),
+    conditions TEXT,
+    rounds_played BIGINT NOT NULL,
+    score_sum BIGINT NOT NULL,
+    PRIMARY KEY (player_id, conditions)
+);
+
+-- add the rounds inserted by one statement to every summary.
+-- rows are upserted in key order - the monthly and weather rows are shared by every load, so
+-- concurrent loads with no players in common still lock them in the same order
+CREATE OR REPLACE FUNCTION add_rounds_to_summaries()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO player_round_summary AS s (player_id, rounds_played, score_sum, best_score, worst_score)
+    SELECT player_id, COUNT(*), SUM(score), MIN(score), MAX(score)
+    FROM new_rounds
+    WHERE player_id IS NOT NULL
+    GROUP BY player_id
+    ORDER BY player_id
+    ON CONFLICT (player_id) DO UPDATE
+    SET rounds_played = s.rounds_played + EXCLUDED.rounds_played,
+        score_sum = s.score_sum + EXCLUDED.score_sum,
+        best_score = LEAST(s.best_score, EXCLUDED.best_score),
+        worst_score = GREATEST(s.worst_score, EXCLUDED.worst_score);
+
+    INSERT INTO weather_impact_summary AS s (weather_category, rounds_played, score_sum, best_score, worst_score)
+    SELECT weather_category(w.precipitation, w.wind_speed, w.avg_temp), COUNT(*), SUM(n.score), MIN(n.score), MAX(n.score)
+    FROM new_rounds n
+    JOIN weather w ON n.round_date = w.date
+    GROUP BY 1
+    ORDER BY 1
+    ON CONFLICT (weather_category) DO UPDATE
+    SET rounds_played = s.rounds_played + EXCLUDED.rounds_played,
+        score_sum = s.score_sum + EXCLUDED.score_sum,
+        best_score = LEAST(s.best_score, EXCLUDED.best_score),
+        worst_score = GREATEST(s.worst_score, EXCLUDED.worst_score);
+
+    INSERT INTO monthly_round_summary AS s (year, month, rounds_played, score_sum)
+    SELECT EXTRACT(YEAR FROM round_date), EXTRACT(MONTH FROM round_date), COUNT(*), SUM(score)
+    FROM new_rounds
+    WHERE round_date IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (year, month) DO UPDATE
+    SET rounds_played = s.rounds_played + EXCLUDED.rounds_played,
+        score_sum = s.score_sum + EXCLUDED.score_sum;
+
+    INSERT INTO player_conditions_summary AS s (player_id, conditions, rounds_played, score_sum)
+    SELECT n.player_id, playing_conditions(w.precipitation, w.wind_speed), COUNT(*), SUM(n.score)
+    FROM new_rounds n
+    JOIN weather w ON n.round_date = w.date
+    WHERE n.player_id IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (player_id, conditions) DO UPDATE
+    SET rounds_played = s.rounds_played + EXCLUDED.rounds_played,
+        score_sum = s.score_sum + EXCLUDED.score_sum;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_add_rounds_to_summaries ON rounds;
+CREATE TRIGGER trigger_add_rounds_to_summaries
+    AFTER INSERT ON rounds
+    REFERENCING NEW TABLE AS new_rounds
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION add_rounds_to_summaries();
+
+-- rebuild every summary from rounds - for updates/deletes, or on a schedule as a consistency check.
+-- DELETE instead of TRUNCATE so reports keep reading the old totals until this commits
+CREATE OR REPLACE FUNCTION refresh_analytics_summaries()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM player_round_summary;
+    INSERT INTO player_round_summary (player_id, rounds_played, score_sum, best_score, worst_score)
+    SELECT player_id, COUNT(*), SUM(score), MIN(score), MAX(score)
+    FROM rounds
+    WHERE player_id IS NOT NULL
+    GROUP BY player_id;
+
+    DELETE FROM weather_impact_summary;
+    INSERT INTO weather_impact_summary (weather_category, rounds_played, score_sum, best_score, worst_score)
+    SELECT weather_category(w.precipitation, w.wind_speed, w.avg_temp), COUNT(*), SUM(r.score), MIN(r.score), MAX(r.score)
+    FROM rounds r
+    JOIN weather w ON r.round_date = w.date
+    GROUP BY 1;
+
+    DELETE FROM monthly_round_summary;
+    INSERT INTO monthly_round_summary (year, month, rounds_played, score_sum)
+    SELECT EXTRACT(YEAR FROM round_date), EXTRACT(MONTH FROM round_date), COUNT(*), SUM(score)
+    FROM rounds
+    WHERE round_date IS NOT NULL
+    GROUP BY 1, 2;
+
+    DELETE FROM player_conditions_summary;
+    INSERT INTO player_conditions_summary (player_id, conditions, rounds_played, score_sum)
+    SELECT r.player_id, playing_conditions(w.precipitation, w.wind_speed), COUNT(*), SUM(r.score)
+    FROM rounds r
+    JOIN weather w ON r.round_date = w.date
+    WHERE r.player_id IS NOT NULL
+    GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- fill the summaries for rounds loaded before they existed
+SELECT refresh_analytics_summaries();
+
+-- rebuild the rolling handicap state, rounds_played and handicap for every player from rounds.
+-- run after rounds are updated or deleted - inserts keep the state current on their own
+CREATE OR REPLACE FUNCTION rebuild_handicap_state()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM player_handicap_state;
+    INSERT INTO player_handicap_state (player_id, round_dates, round_ids, differentials, differential_sum)
+    SELECT player_id,
+           array_agg(round_date ORDER BY rn),
+           array_agg(round_id ORDER BY rn),
+           array_agg(score_differential(score) ORDER BY rn),
+           SUM(score_differential(score))
+    FROM (
+        SELECT player_id, round_date, round_id, score,
+               ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY round_date DESC, round_id DESC) AS rn
+        FROM rounds
+        WHERE player_id IS NOT NULL
+    ) ranked
+    WHERE rn <= 20
+    GROUP BY player_id;
+
+    UPDATE players p
+    SET rounds_played = COALESCE(rc.rounds_played, 0),
+        handicap = CASE WHEN rc.rounds_played IS NULL THEN p.handicap -- keep estimates for players without rounds
+                        ELSE handicap_from_window(s.differential_sum, cardinality(s.differentials)) END
+    FROM players p2
+    LEFT JOIN (SELECT player_id, COUNT(*) AS rounds_played FROM rounds GROUP BY player_id) rc ON rc.player_id = p2.player_id
+    LEFT JOIN player_handicap_state s ON s.player_id = p2.player_id
+    WHERE p.player_id = p2.player_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reloading a changed raw file
+-- a round's source_key and round_date are hashes of its raw row, scores included, so correcting
+-- a score gives the row a new key and new dates - ON CONFLICT can't match it to the rounds loaded
+-- from the old version, and both would be kept. the ETL calls this for changed files in the merge
+-- transaction, before its insert: rounds of those files that aren't in the staged reload are
+-- deleted, their players renumbered, and the handicap state and summaries rebuilt without them.
+-- the insert then adds the corrected rows through the triggers as usual. the rebuilds cover every
+-- player, so they only run when something was removed. returns how many rounds were removed
+CREATE OR REPLACE FUNCTION remove_replaced_rounds(staging_table REGCLASS, changed_files TEXT[])
+RETURNS INTEGER AS $$
+DECLARE
+    removed INTEGER;
+    affected_players INTEGER[];
+BEGIN
+    EXECUTE format($sql$
+        WITH removed AS (
+            DELETE FROM rounds r
+            WHERE r.source_file = ANY($1)
+            AND NOT EXISTS (
+                SELECT 1 FROM %s s
+                WHERE s.player_id = r.player_id
+                AND s.round_date = r.round_date
+                AND s.round_index = r.round_index
+                AND s.source_file = r.source_file
+                AND s.source_key = r.source_key
+            )
+            RETURNING r.player_id
+        )
+        SELECT COUNT(*), array_agg(DISTINCT player_id) FILTER (WHERE player_id IS NOT NULL)
+        FROM removed
+    $sql$, staging_table)
+    INTO removed, affected_players
+    USING changed_files;
+
+    IF removed > 0 THEN
+        PERFORM renumber_rounds(affected_players);
+        PERFORM rebuild_handicap_state();
+        PERFORM refresh_analytics_summaries();
+    END IF;
+
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- players whose rolling state or stored handicap disagree with the full history formula
+-- ((score - 67.3) * 113 / 119 over the last 20 rounds, averaged, times 0.96). empty when everything matches
+CREATE OR REPLACE FUNCTION verify_handicap_state()
+RETURNS TABLE (player_id INTEGER, state_handicap FLOAT, expected_handicap FLOAT, stored_handicap FLOAT) AS $$
+    SELECT p.player_id,
+           handicap_from_window(s.differential_sum, cardinality(s.differentials)),
+           calculate_handicap_for_player(p.player_id),
+           p.handicap
+    FROM players p
+    LEFT JOIN player_handicap_state s ON s.player_id = p.player_id
+    WHERE EXISTS (SELECT 1 FROM rounds r WHERE r.player_id = p.player_id)
+      AND (handicap_from_window(s.differential_sum, cardinality(s.differentials))
+               IS DISTINCT FROM calculate_handicap_for_player(p.player_id)
+           OR p.handicap IS DISTINCT FROM calculate_handicap_for_player(p.player_id)
+           OR s.differential_sum IS DISTINCT FROM (SELECT SUM(d) FROM unnest(s.differentials) AS d));
+$$ LANGUAGE sql STABLE;
+
+-- fill the rolling state for rounds loaded before it existed
+SELECT rebuild_handicap_state();
+
+-- Upgrading rounds loaded before the natural key
+-- they have no round_index/source_file/source_key, so a reload never conflicts with them and
+-- every round would be counted twice. the keys can't be backfilled - those loads picked dates with
+-- rand(), so the rows can't be matched back to their raw rows. they're deleted instead (only the
+-- ETL writes rounds, the raw files still have them), with the handicap state, rounds_played and
+-- summaries rebuilt to match. then reload them with
+--     python -m scripts.run_pipeline --force
+DO $$
+DECLARE
+    unkeyed BIGINT;
+BEGIN
+    DELETE FROM rounds WHERE source_key IS NULL;
+    GET DIAGNOSTICS unkeyed = ROW_COUNT;
+    IF unkeyed > 0 THEN
+        PERFORM rebuild_handicap_state();
+        PERFORM refresh_analytics_summaries();
+        RAISE NOTICE 'Removed % rounds loaded before the natural key - reload them with: python -m scripts.run_pipeline --force', unkeyed;
+    END IF;
+END;
+$$;
@@ -3,6 +3,8 @@
  DS5110 - Final Project - Golf Course Manager
 
  Golf Course Manager Queries for Database
+ These scan rounds in full - the same reports are kept in summary tables
+ (see init.sql and the DatabaseManager report accessors)
  */
 
 -- Player performance summary
@@ -62,4 +64,38 @@ JOIN rounds r ON p.player_id = r.player_id
 JOIN weather w ON r.round_date = w.date
 GROUP BY p.player_name, conditions
 HAVING COUNT(*) >= 3
-ORDER BY conditions, avg_score;
\ No newline at end of file
+ORDER BY conditions, avg_score;
+
+
+-- Same reports from the summary tables
+-- player performance summary
+SELECT p.player_name, p.member_status, p.handicap,
+       COALESCE(s.rounds_played, 0) AS total_rounds,
+       s.score_sum::FLOAT / s.rounds_played AS avg_score,
+       s.best_score, s.worst_score
+FROM players p
+LEFT JOIN player_round_summary s ON p.player_id = s.player_id
+ORDER BY avg_score;
+
+-- weather impact on scores
+SELECT weather_category, rounds_played, score_sum::FLOAT / rounds_played AS avg_score, best_score, worst_score
+FROM weather_impact_summary
+ORDER BY avg_score;
+
+-- monthly trends
+SELECT year, month, rounds_played, score_sum::FLOAT / rounds_played AS avg_score
+FROM monthly_round_summary
+ORDER BY year, month;
+
+-- top performers by conditions
+SELECT p.player_name, s.conditions, s.rounds_played, s.score_sum::FLOAT / s.rounds_played AS avg_score
+FROM player_conditions_summary s
+JOIN players p ON p.player_id = s.player_id
+WHERE s.rounds_played >= 3
+ORDER BY s.conditions, avg_score;
+
+-- rebuild the summaries after rounds are updated or deleted
+SELECT refresh_analytics_summaries();
+
+-- players whose rolling handicap state disagrees with the full history formula (empty when consistent)
+SELECT * FROM verify_handicap_state();
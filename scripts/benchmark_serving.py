@@ -0,0 +1,273 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+Serving benchmarks - latency of the booking and dashboard hot paths
+
+Covers RoundBooking.predict_score / calculate_price, fe.feature_engineering,
+generate_player_charts and DatabaseManager.execute_query. Uses seeded synthetic
+players with 10 to 10,000 rounds. The database is a stub unless --postgres is
+given. Results are saved as JSON with percentiles so runs can be compared
+
+Usage (from the project root):
+    python -m scripts.benchmark_serving
+    python -m scripts.benchmark_serving --compare data/benchmarks/<older run>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from src import database
+from scripts import feature_engineering as fe
+
+SEED = 5110
+ROUND_COUNTS = [10, 100, 1000, 10000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "benchmarks")
+
+
+def synthetic_history(n_rounds, seed=SEED):
+    """seeded round history rows shaped like the dashboard query results"""
+    rng = np.random.default_rng(seed + n_rounds)
+    start = date(2017, 4, 1)
+    offsets = np.sort(rng.integers(0, 6 * 365, n_rounds))
+    return [
+        {
+            'score': int(score),
+            'round_date': start + timedelta(days=int(offset)),
+            'avg_temp': float(temp),
+            'wind_speed': float(wind),
+            'precipitation': float(rain),
+        }
+        for score, offset, temp, wind, rain in zip(
+            rng.normal(80, 8, n_rounds).round(),
+            offsets,
+            rng.normal(18, 8, n_rounds),
+            rng.gamma(2.0, 5.0, n_rounds),
+            rng.exponential(1.5, n_rounds),
+        )
+    ]
+
+
+def synthetic_features(n_rows, seed=SEED):
+    """seeded raw feature rows: round_number, handicap, avg_temp, precipitation, wind_speed, day_of_week_int"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(1, 200, n_rows),
+        rng.uniform(-5, 36, n_rows),
+        rng.normal(18, 8, n_rows),
+        rng.exponential(1.5, n_rows),
+        rng.gamma(2.0, 5.0, n_rows),
+        rng.integers(0, 7, n_rows),
+    ])
+
+
+# stand in for psycopg2 so execute_query runs through the real pool wrapper without a server
+class StubCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = None
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.description = [('column',)]
+        self.rowcount = len(self.rows)
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+class StubConnection:
+    closed = 0
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, cursor_factory=None):
+        return StubCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class StubPool:
+    rows = []
+
+    def __init__(self, minconn, maxconn, **params):
+        self.connections = [StubConnection([]) for _ in range(maxconn)]
+
+    def getconn(self):
+        conn = self.connections.pop()
+        conn.rows = StubPool.rows
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.connections.append(conn)
+
+    def closeall(self):
+        pass
+
+
+@contextmanager
+def stub_database():
+    """swap psycopg2's pool for the stub while benchmarking"""
+    original = database.pg_pool.ThreadedConnectionPool
+    database.close_pools()
+    database.pg_pool.ThreadedConnectionPool = StubPool
+    try:
+        yield
+    finally:
+        database.close_pools()
+        database.pg_pool.ThreadedConnectionPool = original
+
+
+def measure(function, min_seconds=0.5, min_iterations=5, max_iterations=10000):
+    """time repeated calls - returns latency percentiles in milliseconds"""
+    function() # warm up
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_iterations:
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+        if len(timings) >= min_iterations and time.perf_counter() - started > min_seconds:
+            break
+
+    timings = np.array(timings) * 1000
+    return {
+        'iterations': len(timings),
+        'mean_ms': float(timings.mean()),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p90_ms': float(np.percentile(timings, 90)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'max_ms': float(timings.max()),
+    }
+
+
+def run_benchmarks(use_postgres=False, min_seconds=0.5):
+    """run every benchmark - returns {name: stats}"""
+    # imported here so --help and --compare parsing stay fast
+    import src.app as app
+    from src.round_booking import RoundBooking
+
+    results = {}
+
+    def record(name, function, **options):
+        results[name] = measure(function, min_seconds=min_seconds, **options)
+        print(f"{name:<45} p50 {results[name]['p50_ms']:>9.3f} ms   p99 {results[name]['p99_ms']:>9.3f} ms")
+
+    # model and pricing
+    booking = RoundBooking(db=app.db)
+    features = synthetic_features(1000)
+    single = list(features[0])
+    record("predict_score", lambda: booking.predict_score(single))
+    record("predict_scores[n=1000]", lambda: booking.predict_scores(features))
+    record("calculate_price", lambda: booking.calculate_price(10, True, single))
+
+    # feature engineering - old pandas path and the fitted transformer
+    frame = pd.DataFrame([single], columns=fe.RAW_FEATURES)
+    record("fe.feature_engineering", lambda: fe.feature_engineering(frame.copy()))
+    transformer = fe.FeatureTransformer.from_model(booking.score_model)
+    record("FeatureTransformer.transform", lambda: transformer.transform(single))
+
+    # database access
+    if use_postgres:
+        for n_rounds in ROUND_COUNTS:
+            record(f"execute_query[postgres,rows={n_rounds}]",
+                   lambda n=n_rounds: app.db.execute_query("SELECT g AS score FROM generate_series(1, %s) g", (n,)))
+    else:
+        with stub_database():
+            for n_rounds in ROUND_COUNTS:
+                StubPool.rows = synthetic_history(n_rounds)
+                record(f"execute_query[stub,rows={n_rounds}]",
+                       lambda: app.db.execute_query("SELECT score FROM rounds WHERE player_id = %s", (1,)))
+
+    # dashboard charts - full render, then a cached repeat view
+    for n_rounds in ROUND_COUNTS:
+        history = synthetic_history(n_rounds)
+        record(f"render_player_charts[rounds={n_rounds}]",
+               lambda h=history: app.render_player_charts(h), min_iterations=3)
+
+        app.chart_cache.put(n_rounds, (n_rounds, n_rounds), app.render_player_charts(history))
+        record(f"generate_player_charts[cached,rounds={n_rounds}]",
+               lambda n=n_rounds: app.generate_player_charts(n, version=(n, n)))
+
+    return results
+
+
+def environment():
+    """details needed to compare runs"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': SEED,
+    }
+
+
+def compare(current, baseline, threshold):
+    """benchmarks whose p50 or p99 got slower than baseline by more than threshold (fraction)"""
+    regressions = []
+    for name, stats in current.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            if stats[key] > old[key] * (1 + threshold):
+                regressions.append((name, key, old[key], stats[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the serving hot paths")
+    parser.add_argument("--postgres", action="store_true", help="run execute_query against the real database")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="minimum time spent on each benchmark")
+    parser.add_argument("--output", help="results file (default data/benchmarks/serving-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    results = run_benchmarks(use_postgres=args.postgres, min_seconds=args.min_seconds)
+    run = {'environment': environment(), 'results': results}
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"serving-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, key, old, new in regressions:
+            print(f"REGRESSION {name} {key}: {old:.3f} ms -> {new:.3f} ms")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+Booking contention test - many concurrent bookings against the tee time inventory
+
+Fires --requests bookings from --threads threads at once, half of them at a
+single hot tee time, through RoundBooking.create_booking and the shared pool.
+Reports throughput and latency, then checks every slot in the database:
+confirmed bookings never exceed capacity and match the slot's booked count.
+Results are saved as JSON next to the serving benchmarks.
+Needs the golf_analytics database. Uses a far future date and cleans up after itself
+
+Usage (from the project root):
+    python -m scripts.booking_contention --requests 400 --threads 200
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from src.database import DatabaseManager
+from src.round_booking import RoundBooking, TeeTimeFullError
+from scripts.benchmark_serving import RESULTS_DIR, environment
+
+TEST_PLAYER = "Contention Test Player"
+TEE_TIME_HOURS = list(range(6, 21))
+HOT_HOUR = 10
+
+
+def reset(db, date):
+    """remove bookings and slots left on the test date, and the test player"""
+    db.execute_query("DELETE FROM bookings WHERE round_date = %s", (date,))
+    db.execute_query("DELETE FROM tee_time_slots WHERE slot_time::date = %s", (date,))
+    db.execute_query("DELETE FROM players WHERE player_name = %s", (TEST_PLAYER,))
+
+
+def check_inventory(db, date):
+    """slots on the test date whose confirmed bookings exceed capacity or disagree with booked"""
+    rows = db.execute_query("""
+        SELECT s.slot_time, s.capacity, s.booked, COUNT(b.booking_id) AS confirmed
+        FROM tee_time_slots s
+        LEFT JOIN bookings b ON b.tee_time = s.slot_time AND b.booking_status = 'confirmed'
+        WHERE s.slot_time::date = %s
+        GROUP BY s.slot_time, s.capacity, s.booked
+        ORDER BY s.slot_time
+    """, (date,))
+    bad = [row for row in rows if row['confirmed'] > row['capacity'] or row['confirmed'] != row['booked']]
+    return rows, bad
+
+
+def run(n_requests, n_threads, date, connections):
+    """run the contention test - returns throughput, latency and inventory check results"""
+    db = DatabaseManager(max_size=connections)
+    if not db.test_connection():
+        raise Exception("Failed to connect to database - the contention test needs postgres")
+    booking = RoundBooking(db=db)
+    booking.preload()
+
+    reset(db, date)
+    player = db.execute_query(
+        "INSERT INTO players (player_name, handicap) VALUES (%s, %s) RETURNING player_id",
+        (TEST_PLAYER, 18.0)
+    )
+    player_id = player[0]['player_id']
+
+    # half the requests fight over one tee time, the rest are spread over the day
+    hours = [HOT_HOUR if i % 2 == 0 else TEE_TIME_HOURS[i % len(TEE_TIME_HOURS)] for i in range(n_requests)]
+    features = [1, 18.0, 20.0, 0.0, 8.0, datetime.strptime(date, "%Y-%m-%d").weekday()]
+    go = threading.Event() # released once every request is queued, so they all start together
+
+    def book(hour):
+        go.wait()
+        started = time.perf_counter()
+        try:
+            booking.create_booking(TEST_PLAYER, date, hour, False, features, player_id=player_id)
+            outcome = 'confirmed'
+        except TeeTimeFullError:
+            outcome = 'full'
+        except Exception as e:
+            print(f"Booking error: {e}")
+            outcome = 'error'
+        return outcome, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        futures = [pool.submit(book, hour) for hour in hours]
+        started = time.perf_counter()
+        go.set()
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    outcomes = Counter(outcome for outcome, _ in results)
+    latencies = np.array([seconds for _, seconds in results]) * 1000
+    requested = Counter(hours)
+    expected = sum(min(count, booking.slot_capacity) for count in requested.values())
+
+    results = {
+        'requests': n_requests,
+        'threads': n_threads,
+        'connections': connections,
+        'seconds': elapsed,
+        'bookings_per_second': n_requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'confirmed': outcomes['confirmed'],
+        'expected_confirmed': expected,
+        'full': outcomes['full'],
+        'errors': outcomes['error'],
+    }
+    print(f"{n_requests} bookings from {n_threads} threads over {connections} connections in {elapsed:.2f}s "
+          f"({results['bookings_per_second']:.0f} bookings/s)")
+    print(f"confirmed {outcomes['confirmed']} (expected {expected}), full {outcomes['full']}, errors {outcomes['error']}")
+    print(f"latency p50 {results['p50_ms']:.1f} ms, p95 {results['p95_ms']:.1f} ms, p99 {results['p99_ms']:.1f} ms")
+    print(f"pool: {db.pool_stats()}")
+
+    rows, bad = check_inventory(db, date)
+    for row in rows:
+        print(f"  {row['slot_time']:%H:%M} booked {row['booked']}/{row['capacity']}, confirmed bookings {row['confirmed']}")
+    for row in bad:
+        print(f"OVERBOOKED {row['slot_time']}: {row['confirmed']} bookings, capacity {row['capacity']}, booked {row['booked']}")
+
+    reset(db, date)
+    results['overbooked_slots'] = len(bad)
+    results['ok'] = not bad and outcomes['confirmed'] == expected and outcomes['error'] == 0
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent booking test for the tee time inventory")
+    parser.add_argument("--requests", type=int, default=400, help="number of bookings to attempt")
+    parser.add_argument("--threads", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--connections", type=int, default=20, help="database pool size")
+    parser.add_argument("--date", default="2099-06-15", help="test date - its bookings are deleted")
+    parser.add_argument("--output", help="results file (default data/benchmarks/contention-<timestamp>.json)")
+    args = parser.parse_args()
+
+    results = run(args.requests, args.threads, args.date, args.connections)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"contention-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"Results saved to {output}")
+
+    print("No overbooking" if results['ok'] else "FAILED")
+    sys.exit(0 if results['ok'] else 1)
@@ -2,20 +2,108 @@
 Author: Thomas Kulch
 DS5110 - Final Project - Golf Course Manager
 Feautre Engineering module - Used in round_booking.py
+
+FeatureTransformer freezes column order, scaler parameters and the derived
+features so training and serving build the model matrix the same way
 """
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 
+# raw inputs, in the order serving passes them
+RAW_FEATURES = ['round_number', 'handicap', 'avg_temp', 'precipitation', 'wind_speed', 'day_of_week_int']
+FEATURES_TO_SCALE = ['round_number', 'handicap', 'avg_temp', 'precipitation', 'wind_speed']
+DERIVED_FEATURES = ['wind_precip', 'wind_cold', 'bad_weather_combo', 'weekend']
 
-def feature_engineering(df, scaler=None):
-    """feature engineering for new records without scaling"""
-    # create new features
+
+def add_derived_features(df):
+    """add wind_precip, wind_cold, bad_weather_combo and weekend to df (unscaled inputs)"""
     df['wind_precip'] = df['precipitation'] * df['wind_speed']
     df['wind_cold'] = df['wind_speed'] * (df['avg_temp'] < 15).astype(int)
     df['bad_weather_combo'] = ((df['wind_speed'] > 15) &
                            (df['precipitation'] > 0.5) &
                            (df['avg_temp'] < 15)).astype(int)
     df['weekend'] = (df['day_of_week_int'] >= 5)
+    return df
+
+
+class FeatureTransformer:
+    """raw feature rows -> model matrix in one numpy pass"""
+    def __init__(self, feature_names, mean, scale):
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=float) # per FEATURES_TO_SCALE
+        self.scale = np.asarray(scale, dtype=float)
+
+        # frozen plan: which output column comes from which raw column
+        self._raw_index = {name: i for i, name in enumerate(RAW_FEATURES)}
+        self._scaled_index = {name: i for i, name in enumerate(FEATURES_TO_SCALE)}
+        self._plan = [(position, name) for position, name in enumerate(self.feature_names)]
+
+    @classmethod
+    def fit(cls, df):
+        """fit scaler parameters on training data - output columns are df's columns (minus score) plus derived"""
+        scaler = StandardScaler().fit(df[FEATURES_TO_SCALE])
+        feature_names = [c for c in df.columns if c != 'score']
+        feature_names += [c for c in DERIVED_FEATURES if c not in feature_names]
+        return cls(feature_names, scaler.mean_, scaler.scale_), scaler
+
+    @classmethod
+    def from_model(cls, score_model):
+        """build from a saved model package (scaler + feature_names)"""
+        scaler = score_model['scaler']
+        return cls(score_model['feature_names'], scaler.mean_, scaler.scale_)
+
+    def transform(self, raw):
+        """raw rows (n x RAW_FEATURES) -> model matrix (n x feature_names)
+        columns the transformer can't build are filled with 0"""
+        raw = np.asarray(raw, dtype=float)
+        if raw.ndim == 1:
+            raw = raw.reshape(1, -1)
+
+        avg_temp = raw[:, self._raw_index['avg_temp']]
+        precipitation = raw[:, self._raw_index['precipitation']]
+        wind_speed = raw[:, self._raw_index['wind_speed']]
+        cold = avg_temp < 15
+
+        out = np.empty((raw.shape[0], len(self.feature_names)))
+        for position, name in self._plan:
+            column = out[:, position]
+            if name in self._scaled_index:
+                i = self._scaled_index[name]
+                np.subtract(raw[:, self._raw_index[name]], self.mean[i], out=column)
+                np.divide(column, self.scale[i], out=column)
+            elif name in self._raw_index:
+                column[:] = raw[:, self._raw_index[name]]
+            elif name == 'wind_precip':
+                np.multiply(precipitation, wind_speed, out=column)
+            elif name == 'wind_cold':
+                np.multiply(wind_speed, cold, out=column)
+            elif name == 'bad_weather_combo':
+                column[:] = (wind_speed > 15) & (precipitation > 0.5) & cold
+            elif name == 'weekend':
+                column[:] = raw[:, self._raw_index['day_of_week_int']] >= 5
+            else:
+                column[:] = 0 # not known at serving time, same as the old padding
+
+        return out
+
+    def transform_frame(self, df):
+        """DataFrame version for training - same values, named columns"""
+        X = pd.DataFrame(self.transform(df[RAW_FEATURES].to_numpy(dtype=float)),
+                         columns=self.feature_names, index=df.index)
+
+        # any other training columns pass through unchanged
+        known = set(RAW_FEATURES) | set(DERIVED_FEATURES)
+        for name in self.feature_names:
+            if name not in known and name in df.columns:
+                X[name] = df[name]
+        return X
+
+
+def feature_engineering(df, scaler=None):
+    """feature engineering for new records without scaling"""
+    # create new features
+    add_derived_features(df)
 
     # get features, target, and scaler
     if 'score' in df.columns: # for reusability
@@ -26,21 +114,11 @@ def feature_engineering(df, scaler=None):
         return df
 
 def feature_engineering_with_scaling(df):
-    """feature engineering for initial training with scaling included"""
-    df['wind_precip'] = df['precipitation'] * df['wind_speed']
-    df['wind_cold'] = df['wind_speed'] * (df['avg_temp'] < 15).astype(int)
-    df['bad_weather_combo'] = ((df['wind_speed'] > 15) &
-                           (df['precipitation'] > 0.5) &
-                           (df['avg_temp'] < 15)).astype(int)
-    df['weekend'] = (df['day_of_week_int'] >= 5)
-
-    features_to_scale = ['round_number', 'handicap', 'avg_temp',
-                   'precipitation', 'wind_speed']
-
-    scaler = StandardScaler()
-    df[features_to_scale] = scaler.fit_transform(df[features_to_scale])
+    """feature engineering for initial training with scaling included
+    uses the same FeatureTransformer as serving - scaler is returned for the saved model package"""
+    transformer, scaler = FeatureTransformer.fit(df)
 
-    X = df.drop(['score'], axis=1)
+    X = transformer.transform_frame(df)
     y = df['score']
 
-    return X, y, scaler
\ No newline at end of file
+    return X, y, scaler
@@ -0,0 +1,137 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+Synthetic data generator - raw golf and weather files at any scale
+
+Writes files in the same layouts as data/raw so DataProcessor can load them:
+    golf_synthetic_part<N>.csv   Year,Name,Course,...,Open.R1..Open.R4 (4 rounds per row)
+    boston_weather_data.csv      time,tavg,tmin,tmax,prcp,wdir,wspd,pres
+Every chunk has its own seed derived from --seed, so the output is the same on
+every run no matter how it is split into part files
+
+Usage (from the project root):
+    python -m scripts.generate_synthetic_data --rounds 1000000 --out data/synthetic/1000000
+"""
+import argparse
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+SEED = 5110
+GOLF_COLUMNS = ['Year', 'Name', 'Course', 'Yards', 'Par', 'Open.Position', 'Integer.Position',
+                'Position.Grouping', 'Open.R1', 'Open.R2', 'Open.R3', 'Open.R4']
+WEATHER_COLUMNS = ['time', 'tavg', 'tmin', 'tmax', 'prcp', 'wdir', 'wspd', 'pres']
+
+# (course, yards, par) - same style as the open championship data
+COURSES = [
+    ("Royal St Georges", 7189, 70),
+    ("Royal Portrush", 7344, 71),
+    ("Carnoustie", 7402, 71),
+    ("Royal Birkdale", 7156, 70),
+    ("Royal Troon", 7190, 71),
+    ("St Andrews", 7313, 72),
+]
+
+ROUNDS_PER_ROW = 4
+ROWS_PER_CHUNK = 1_000_000 # golf rows generated and written at a time
+ROWS_PER_FILE = 5_000_000 # golf rows per part file
+
+
+def player_skill(n_players, seed=SEED):
+    """seeded scoring average for every player"""
+    rng = np.random.default_rng([seed, 0])
+    return rng.normal(88, 10, n_players)
+
+
+def golf_chunk(chunk_index, n_rows, skill, years, seed=SEED):
+    """one chunk of golf rows as a DataFrame - depends only on the seed and chunk index"""
+    rng = np.random.default_rng([seed, 1, chunk_index])
+    player = rng.integers(0, len(skill), n_rows)
+    course = rng.integers(0, len(COURSES), n_rows)
+    scores = np.rint(skill[player, None] + rng.normal(0, 4, (n_rows, ROUNDS_PER_ROW)))
+    scores = np.clip(scores, 60, 140).astype(int)
+    position = rng.integers(1, 157, n_rows)
+
+    names, yards, par = zip(*COURSES)
+    return pd.DataFrame({
+        'Year': rng.integers(years[0], years[1] + 1, n_rows),
+        'Name': np.char.add("Player ", np.char.zfill(player.astype(str), 7)),
+        'Course': np.array(names)[course],
+        'Yards': np.array(yards)[course],
+        'Par': np.array(par)[course],
+        'Open.Position': position,
+        'Integer.Position': position,
+        'Position.Grouping': np.minimum(position // 10 + 1, 10),
+        'Open.R1': scores[:, 0],
+        'Open.R2': scores[:, 1],
+        'Open.R3': scores[:, 2],
+        'Open.R4': scores[:, 3],
+    }, columns=GOLF_COLUMNS)
+
+
+def weather_frame(years, seed=SEED):
+    """daily weather for every day in the year range - seasonal temperatures, random rain and wind"""
+    rng = np.random.default_rng([seed, 2])
+    days = pd.date_range(date(years[0], 1, 1), date(years[1], 12, 31), freq="D")
+    n_days = len(days)
+
+    seasonal = 11 - 13 * np.cos(2 * np.pi * (days.dayofyear.to_numpy() - 15) / 365.25)
+    tavg = np.round(seasonal + rng.normal(0, 3, n_days), 1)
+    spread = rng.uniform(2, 8, n_days)
+    rain = rng.random(n_days) < 0.3
+
+    return pd.DataFrame({
+        'time': days.strftime("%Y-%m-%d"),
+        'tavg': tavg,
+        'tmin': np.round(tavg - spread / 2, 1),
+        'tmax': np.round(tavg + spread / 2, 1),
+        'prcp': np.where(rain, np.round(rng.exponential(4, n_days), 1), 0.0),
+        'wdir': np.round(rng.uniform(0, 360, n_days)),
+        'wspd': np.round(rng.gamma(3, 4.5, n_days), 1),
+        'pres': np.round(rng.normal(1015, 8, n_days), 1),
+    }, columns=WEATHER_COLUMNS)
+
+
+def generate(n_rounds, out_dir, n_players=None, years=(2013, 2022), seed=SEED):
+    """write golf part files and the weather file to out_dir - returns the golf file paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    n_rows = -(-n_rounds // ROUNDS_PER_ROW) # ceil, 4 rounds per row
+    n_players = n_players or max(100, n_rows // 50)
+    skill = player_skill(n_players, seed)
+
+    golf_files = []
+    written = 0
+    chunk_index = 0
+    while written < n_rows:
+        part = written // ROWS_PER_FILE
+        path = os.path.join(out_dir, f"golf_synthetic_part{part:04d}.csv")
+        new_file = not golf_files or golf_files[-1] != path
+        if new_file:
+            golf_files.append(path)
+        chunk_rows = min(ROWS_PER_CHUNK, n_rows - written, (part + 1) * ROWS_PER_FILE - written)
+
+        golf_chunk(chunk_index, chunk_rows, skill, years, seed) \
+            .to_csv(path, mode="w" if new_file else "a", header=new_file, index=False)
+
+        written += chunk_rows
+        chunk_index += 1
+        print(f"Wrote {written * ROUNDS_PER_ROW:,} of {n_rows * ROUNDS_PER_ROW:,} rounds")
+
+    weather_frame(years, seed).to_csv(os.path.join(out_dir, "boston_weather_data.csv"), index=False)
+    print(f"Wrote {len(golf_files)} golf files and weather for {years[0]}-{years[1]} to {out_dir}")
+    return golf_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate seeded raw golf and weather files")
+    parser.add_argument("--rounds", type=int, default=1_000_000, help="number of rounds (4 per golf row)")
+    parser.add_argument("--players", type=int, help="number of distinct players (default rows / 50)")
+    parser.add_argument("--years", default="2013-2022", help="weather date range, must cover 2017-2022 round dates")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", default=os.path.join("data", "synthetic"), help="output directory")
+    args = parser.parse_args()
+
+    first_year, last_year = (int(y) for y in args.years.split("-"))
+    generate(args.rounds, args.out, n_players=args.players, years=(first_year, last_year), seed=args.seed)
@@ -0,0 +1,135 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+Partition maintenance - season partitions of rounds and bookings
+
+    list                        partitions with their row estimates and size
+    create --ahead 2            create partitions through this season + 2 (run yearly, e.g. from cron)
+    detach --before 2019        detach partitions ending by 2019 and move them to the archive schema
+           [--tablespace cold]  and optionally to a cheaper tablespace
+           [--skip-rebuild]     leave the handicap state and summaries alone
+
+Detached seasons drop out of rounds and bookings but keep their rows in
+archive.<table>_<season>. Reattach with
+    ALTER TABLE archive.rounds_2017 SET SCHEMA public;
+    ALTER TABLE rounds ATTACH PARTITION rounds_2017 FOR VALUES FROM ('2017-01-01') TO ('2018-01-01');
+The handicap state and analytics summaries still count detached rounds, so detach
+rebuilds them afterwards (rebuild_handicap_state / refresh_analytics) unless
+--skip-rebuild is given - run those yourself after reattaching
+
+Usage (from the project root):
+    python -m scripts.manage_partitions create --ahead 2
+"""
+import argparse
+from datetime import date
+
+from src.database import DatabaseManager
+
+PARTITIONED_TABLES = ['rounds', 'bookings']
+ARCHIVE_SCHEMA = "archive"
+
+
+def list_partitions(db):
+    """season partitions currently attached to rounds and bookings"""
+    return db.execute_query("""
+        SELECT parent.relname AS parent, child.relname AS partition,
+               pg_get_expr(child.relpartbound, child.oid) AS bounds,
+               child.reltuples::BIGINT AS estimated_rows,
+               pg_size_pretty(pg_total_relation_size(child.oid)) AS size
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = ANY(%s)
+        ORDER BY parent.relname, child.relname
+    """, (PARTITIONED_TABLES,))
+
+
+def create_partitions(db, ahead=2):
+    """make sure every season from this one through this + ahead has a partition - returns how many were created"""
+    this_season = date.today().year
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT create_season_partitions(%s, %s)", (this_season, this_season + ahead))
+            created = cur.fetchone()[0]
+        conn.commit()
+    return created
+
+
+def partitions_ending_by(cur, before):
+    """(parent, partition) for every range partition whose upper bound is on or before Jan 1 of `before`
+    read from the catalog, so partitions of any age or name are found - the default partition has no bound"""
+    cur.execute("""
+        SELECT parent, partition
+        FROM (
+            SELECT parent.relname AS parent, child.relname AS partition,
+                   substring(pg_get_expr(child.relpartbound, child.oid) FROM 'TO \\(''([^'']+)''\\)')::DATE AS upper_bound
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            JOIN pg_namespace n ON n.oid = child.relnamespace
+            WHERE parent.relname = ANY(%s) AND n.nspname = 'public'
+        ) bounds
+        WHERE upper_bound <= make_date(%s, 1, 1)
+        ORDER BY parent, upper_bound
+    """, (PARTITIONED_TABLES, before))
+    return cur.fetchall()
+
+
+def detach_seasons(db, before, tablespace=None, rebuild=True):
+    """detach every partition ending by `before` and move it to the archive schema
+    rebuild=True then rebuilds the handicap state and summaries, which still counted the detached rounds"""
+    detached = []
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+            for parent, partition in partitions_ending_by(cur, before):
+                # not CONCURRENTLY - postgres doesn't allow it while a default partition exists.
+                # the parent is locked only while the catalog changes, rows aren't moved
+                cur.execute(f"ALTER TABLE {parent} DETACH PARTITION {partition}")
+                cur.execute(f"ALTER TABLE {partition} SET SCHEMA {ARCHIVE_SCHEMA}")
+                detached.append(partition)
+        conn.commit()
+
+        # moving to another tablespace rewrites the table, so it's done after the detach is committed
+        if tablespace:
+            with conn.cursor() as cur:
+                for partition in detached:
+                    cur.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{partition} SET TABLESPACE {tablespace}")
+                    conn.commit()
+
+    for partition in detached:
+        print(f"Detached {partition} to {ARCHIVE_SCHEMA}.{partition}")
+
+    if any(partition.startswith('rounds') for partition in detached):
+        if rebuild:
+            print("Rebuilding handicap state and analytics summaries without the detached rounds")
+            db.rebuild_handicap_state()
+            db.refresh_analytics()
+        else:
+            print("Handicap state and summaries still count the detached rounds - "
+                  "run rebuild_handicap_state() and refresh_analytics()")
+    return detached
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage season partitions of rounds and bookings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show partitions")
+    create_parser = commands.add_parser("create", help="create upcoming season partitions")
+    create_parser.add_argument("--ahead", type=int, default=2, help="seasons after this one to create")
+    detach_parser = commands.add_parser("detach", help="detach old seasons to the archive schema")
+    detach_parser.add_argument("--before", type=int, required=True, help="detach seasons before this year")
+    detach_parser.add_argument("--tablespace", help="tablespace to move detached seasons to")
+    detach_parser.add_argument("--skip-rebuild", action="store_true",
+                               help="don't rebuild the handicap state and summaries after detaching")
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    if args.command == "list":
+        for row in list_partitions(db) or []:
+            print(f"{row['partition']:<20} {row['bounds']:<60} {row['estimated_rows']:>12} rows {row['size']:>10}")
+    elif args.command == "create":
+        print(f"Created {create_partitions(db, args.ahead)} partitions")
+    else:
+        detached = detach_seasons(db, args.before, args.tablespace, rebuild=not args.skip_rebuild)
+        print(f"Detached {len(detached)} partitions")
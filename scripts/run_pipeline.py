@@ -2,22 +2,174 @@
 Author: Thomas Kulch
 DS5110 - Final Project -  Golf Course Manager
 Pipeline runner module - Use for scheduling
+
+--engine picks the ETL engine: spark, local (pandas, no JVM) or auto, which
+uses the local engine when the raw files still to load are small. Both give
+the same database state
+
+Benchmark mode generates seeded synthetic raw files at each scale (number of
+rounds) and records wall time, shuffle bytes and rows/s for every stage.
+It loads into the configured database, so point it at a scratch copy
+    python -m scripts.run_pipeline --benchmark --scales 100000,1000000,10000000
 """
-from src import data_processing
+import argparse
+import json
+import os
+import platform
+from datetime import datetime
+
+from src.etl_engine import ENGINES, create_processor
+from src.metrics import registry
+from scripts import generate_synthetic_data
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def materialize(df, stage):
+    """cache and count a stage's output so its time isn't charged to the next stage
+    pandas frames are already in memory and are only counted"""
+    if df is None:
+        return None
+    if hasattr(df, "cache"):
+        df.cache()
+        rows = df.count()
+    else:
+        rows = len(df)
+    stage['rows'] = (stage['rows'] or 0) + rows
+    return df
 
-def main():
-    # initialize ETL and dataframes
-    process = data_processing.DataProcessor()
-    df_golf_raw, df_weather_raw = process.extract_raw_data()
+
+def run_etl(process, force=False, benchmark=False):
+    """extract, clean and load new files with per stage timing in process.stage_stats
+    benchmark=True materializes every intermediate result so stages are timed separately"""
+    with process.stage("extract") as stage:
+        df_golf_raw, df_weather_raw = process.extract_raw_data(force=force)
+        if benchmark:
+            materialize(df_golf_raw, stage)
+            materialize(df_weather_raw, stage)
+
+    if df_golf_raw is None and df_weather_raw is None:
+        print("Nothing new to load")
+        process.mark_files_ingested() # still record files that were only touched
+        return
 
     # clean data
-    df_golf_cleaned = process.clean_golf_data(df_golf_raw)
-    df_weather_cleaned = process.clean_weather_data(df_weather_raw)
+    df_golf_cleaned = df_weather_cleaned = None
+    if df_golf_raw is not None:
+        with process.stage("clean_golf") as stage:
+            df_golf_cleaned = process.clean_golf_data(df_golf_raw)
+            if benchmark:
+                materialize(df_golf_cleaned, stage)
+    if df_weather_raw is not None:
+        with process.stage("clean_weather") as stage:
+            df_weather_cleaned = process.clean_weather_data(df_weather_raw)
+            if benchmark:
+                materialize(df_weather_cleaned, stage)
+
+    # load data to db - stage rows are the rows written
+    loads = [
+        ("load_players", process.process_players, df_golf_cleaned),
+        ("load_weather", process.import_weather_to_database, df_weather_cleaned),
+        ("load_rounds", process.import_rounds_to_database, df_golf_cleaned),
+    ]
+    for name, load, df in loads:
+        if df is None:
+            continue
+        with process.stage(name):
+            load(df)
+
+    # record loaded files so the next run skips them
+    process.mark_files_ingested()
+
+
+def main(write_backends=None, metrics_file=None, engine='auto', force=False):
+    # initialize ETL and dataframes - only files not yet in the ingestion manifest are returned,
+    # or every raw file with force=True (rounds already loaded are still skipped by their natural key)
+    # write_backends picks jdbc or copy per table for spark, e.g. {'rounds': 'copy'} - local always copies
+    process = create_processor(engine, write_backends=write_backends, force=force)
+    run_etl(process, force=force)
+
+    # release cached reference tables
+    process.clear_dimension_cache()
+
+    # load throughput per table, to compare the jdbc and copy backends
+    for stats in process.load_stats:
+        new_rows = f" ({stats['inserted']} new)" if stats.get('inserted') is not None else ""
+        print(f"{stats['table']}: {stats['rows']} rows{new_rows} via {stats['backend']} at {stats['rows_per_second']:.0f} rows/s")
+
+    # stage and query metrics for node_exporter's textfile collector - batch runs can't be scraped directly
+    if metrics_file:
+        registry.write_textfile(metrics_file)
+        print(f"Metrics written to {metrics_file}")
+
+
+def benchmark(scales, write_backends=None, seed=generate_synthetic_data.SEED, output=None, engine='auto'):
+    """run the full pipeline on seeded synthetic data at each scale - returns the results"""
+    results = []
+    for n_rounds in scales:
+        scale_dir = os.path.join(DATA_DIR, "synthetic", str(n_rounds))
+        if not os.path.isdir(scale_dir):
+            generate_synthetic_data.generate(n_rounds, scale_dir, seed=seed)
+
+        # each scale gets its own raw, staging and manifest paths
+        process = create_processor(engine, write_backends=write_backends, date_seed=seed,
+                                   raw_directory=scale_dir + os.sep,
+                                   staged_directory=os.path.join(scale_dir, "staged"),
+                                   manifest_path=os.path.join(scale_dir, "ingest_manifest.json"),
+                                   force=True)
+
+        print(f"Benchmarking {process.engine} pipeline at {n_rounds:,} rounds")
+        run_etl(process, force=True, benchmark=True)
+        process.clear_dimension_cache()
+        if process.engine == 'spark':
+            process.spark.catalog.clearCache()
+
+        results.append({'rounds': n_rounds, 'engine': process.engine,
+                        'stages': process.stage_stats, 'loads': process.load_stats})
+        for stage in process.stage_stats:
+            rate = f"{stage['rows_per_second']:.0f} rows/s" if 'rows_per_second' in stage else "-"
+            shuffle = stage.get('shuffle_write_bytes')
+            shuffle = f"{shuffle / 1e6:.1f} MB shuffled" if shuffle is not None else "shuffle n/a"
+            print(f"  {stage['stage']:<14} {stage['seconds']:>9.2f}s  {rate:>16}  {shuffle}")
+
+    run = {
+        'environment': {
+            'timestamp': datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'write_backends': write_backends or {},
+            'engine': engine,
+        },
+        'results': results,
+    }
+    output = output or os.path.join(DATA_DIR, "benchmarks", f"pipeline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results saved to {output}")
+    return run
 
-    # load data to db
-    process.process_players(df_golf_cleaned)
-    process.import_weather_to_database(df_weather_cleaned)
-    process.import_rounds_to_database(df_golf_cleaned)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the golf ETL pipeline")
+    parser.add_argument("--copy", default="",
+                        help="comma separated tables to load with COPY instead of JDBC (players,weather,rounds)")
+    parser.add_argument("--engine", choices=ENGINES, default="auto",
+                        help="spark, local (pandas) or auto - local when the new raw files are small")
+    parser.add_argument("--force", action="store_true",
+                        help="reload every raw file, ignoring the ingestion manifest (e.g. after upgrading init.sql)")
+    parser.add_argument("--benchmark", action="store_true", help="time the pipeline on synthetic data instead")
+    parser.add_argument("--scales", default="100000,1000000,10000000",
+                        help="comma separated numbers of rounds to benchmark")
+    parser.add_argument("--seed", type=int, default=generate_synthetic_data.SEED)
+    parser.add_argument("--output", help="benchmark results file (default data/benchmarks/pipeline-<timestamp>.json)")
+    parser.add_argument("--metrics-file", help="write Prometheus metrics for the run to this file (e.g. a .prom file)")
+    args = parser.parse_args()
+
+    write_backends = {table: "copy" for table in args.copy.split(",") if table}
+    if args.benchmark:
+        benchmark([int(n) for n in args.scales.split(",")], write_backends=write_backends,
+                  seed=args.seed, output=args.output, engine=args.engine)
+    else:
+        main(write_backends=write_backends, metrics_file=args.metrics_file, engine=args.engine, force=args.force)
@@ -0,0 +1,78 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+Startup latency of the Flask app - import, create_app and first requests
+
+Each run is a fresh interpreter, so nothing is cached from the previous one.
+Measures importing src.app, create_app() (with and without preload), the first
+GET / and the first score prediction - the cost the first booking pays when
+the model wasn't preloaded. Uses the configured database for the weather
+preload; without one the model is still preloaded and weather shows as not loaded
+
+Usage (from the project root):
+    python -m scripts.startup_latency --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# runs in the child interpreter - prints one JSON line of timings in milliseconds
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import src.app as app_module
+imported = time.perf_counter()
+timings = {'import_ms': (imported - started) * 1000,
+           'modules_after_import': len(sys.modules)}
+
+started = time.perf_counter()
+app = app_module.create_app(preload=PRELOAD)
+timings['create_app_ms'] = (time.perf_counter() - started) * 1000
+
+client = app.test_client()
+started = time.perf_counter()
+client.get('/')
+timings['first_index_ms'] = (time.perf_counter() - started) * 1000
+
+started = time.perf_counter()
+app_module.services.booking_system.predict_score([1, 10.0, 15.0, 0.0, 5.0, 2])
+timings['first_prediction_ms'] = (time.perf_counter() - started) * 1000
+timings['weather_loaded'] = app_module.services.status()['weather_loaded']
+print(json.dumps(timings))
+"""
+
+
+def run_once(preload):
+    """timings from one fresh interpreter"""
+    code = CHILD.replace("PRELOAD", repr(preload))
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(PROJECT_ROOT))
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(PROJECT_ROOT, "src"),
+                            env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(runs=5):
+    """median of each timing over fresh interpreters, without and with preload"""
+    results = {}
+    for preload in (False, True):
+        samples = [run_once(preload) for _ in range(runs)]
+        results['preload' if preload else 'lazy'] = {
+            key: statistics.median(sample[key] for sample in samples) for key in samples[0]
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import and first request latency of the Flask app")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode")
+    args = parser.parse_args()
+
+    for mode, timings in measure(args.runs).items():
+        print(f"{mode:<8} import {timings['import_ms']:>7.0f} ms   create_app {timings['create_app_ms']:>7.0f} ms   "
+              f"first / {timings['first_index_ms']:>6.1f} ms   first prediction {timings['first_prediction_ms']:>7.1f} ms   "
+              f"({timings['modules_after_import']:.0f} modules after import, weather loaded: {bool(timings['weather_loaded'])})")
@@ -7,67 +7,316 @@ Frontend Flask application for Round Booking
 Requirements
     -templates directory with index.html and dashboard.html
     -golf_analytics database setup
+
+create_app() builds the app. Importing this module is cheap - the database manager,
+model, weather and chart subsystems are built on first use. /ready reports when a
+worker is warm. Pre-forking servers can load everything once before forking:
+    GOLF_PRELOAD=1 gunicorn --preload -w 4 "src.app:create_app()"
 """
-from flask import Flask, render_template, request, redirect, url_for, flash
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # For server-side plotting
-import matplotlib.pyplot as plt
-import io
-import base64
-from datetime import datetime
-
-from database import DatabaseManager
-from round_booking import RoundBooking
-
-app = Flask(__name__)
-app.secret_key = 'test' # need secret key for this to work
-
-# connect to db and initialize round booking system
-db = DatabaseManager()
-booking_system = RoundBooking()
-
-@app.route('/', methods=['GET', 'POST'])
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, flash, jsonify, g, Response
+import gc
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import json
+
+# only light modules at import time - pandas, numpy, sklearn and the model load with the first
+# route that needs them, or up front with create_app(preload=True)
+# import through the src package so app.py and round_booking share one database module (and pool)
+from src import database
+from src.database import DatabaseManager
+from src.chart_cache import ChartCache
+from src.versioned_cache import VersionedLRUCache
+from src.metrics import registry
+
+# tee times offered on the booking form
+TEE_TIME_HOURS = list(range(6, 21))
+MAX_QUOTE_DAYS = 31
+MAX_CHART_POINTS = 2000
+
+# request latency per route template, so /player/<name> is one series rather than one per player
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Flask request latency by route", ("endpoint", "method", "status"))
+POOL_STATS = registry.gauge("db_pool_stat", "Connection pool counters from DatabaseManager.pool_stats", ("stat",))
+CACHE_STATS = registry.gauge("cache_stat", "Cache entries, bytes, hits and misses", ("cache", "stat"))
+
+class Services:
+    """subsystems used by the routes - each one is built on first use, once per process"""
+    names = ('db', 'booking_system', 'chart_cache', 'chart_renderer', 'chart_data_cache', 'quote_cache', 'weather_store')
+
+    def __init__(self):
+        self._instances = {}
+        self._lock = threading.RLock() # building one subsystem can build another
+        self._warming = False
+        self.warm_error = None
+
+    def _get(self, name, build):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = build()
+        return instance
+
+    def loaded(self, name):
+        """subsystem if it has been built, else None - never builds it"""
+        return self._instances.get(name)
+
+    @property
+    def db(self):
+        # connect to db - the pool itself opens on the first query
+        return self._get('db', DatabaseManager)
+
+    @property
+    def booking_system(self):
+        # round booking system - the model loads on the first prediction, or in warm_up()
+        def build():
+            from src.round_booking import RoundBooking
+            return RoundBooking(db=self.db)
+        return self._get('booking_system', build)
+
+    @property
+    def chart_cache(self):
+        # rendered charts per player, reused until the player's rounds change
+        return self._get('chart_cache', ChartCache)
+
+    @property
+    def chart_renderer(self):
+        # charts are drawn in worker processes and land in chart_cache when done
+        def build():
+            from src.chart_renderer import ChartRenderer
+            return ChartRenderer(self.chart_cache)
+        return self._get('chart_renderer', build)
+
+    @property
+    def chart_data_cache(self):
+        # downsampled chart points per (player, max points), for charts drawn in the browser
+        return self._get('chart_data_cache', lambda: VersionedLRUCache(
+            max_entries=1024, max_bytes=16 * 1024 * 1024, size_of=lambda data: len(json.dumps(data))))
+
+    @property
+    def quote_cache(self):
+        # tee sheet quotes per player and date range, reused until weather or the player's handicap changes
+        return self._get('quote_cache', lambda: VersionedLRUCache(
+            max_entries=1024, max_bytes=16 * 1024 * 1024, size_of=lambda quote: len(json.dumps(quote))))
+
+    @property
+    def weather_store(self):
+        # weather table held in memory - loaded on first booking, reloaded when the table changes
+        def build():
+            from src.weather_store import WeatherStore
+            store = WeatherStore(self.db)
+            # charts and quotes include weather, so drop them when new weather is loaded
+            store.on_refresh(self.chart_cache.invalidate)
+            store.on_refresh(self.chart_data_cache.invalidate)
+            store.on_refresh(self.quote_cache.invalidate)
+            return store
+        return self._get('weather_store', build)
+
+    def warm_up(self):
+        """load the model, weather and chart modules now instead of on the first requests that need them
+        returns True if everything loaded"""
+        try:
+            self.booking_system.preload()
+            if not self.weather_store.loaded and not self.weather_store.refresh():
+                raise RuntimeError("weather data unavailable")
+            import src.chart_renderer # noqa: F401 - numpy/pandas for chart data
+            self.warm_error = None
+            return True
+        except Exception as e:
+            self.warm_error = str(e)
+            print(f"Warm up failed: {e}")
+            return False
+
+    def warm_up_in_background(self):
+        """start warm_up on a thread unless one is already running"""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+
+        def run():
+            try:
+                self.warm_up()
+            finally:
+                self._warming = False
+
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+    def status(self):
+        """what's loaded so far, without loading anything"""
+        booking_system = self.loaded('booking_system')
+        weather_store = self.loaded('weather_store')
+        return {
+            'model_version': booking_system.models.version if booking_system is not None else None,
+            'weather_loaded': weather_store is not None and weather_store.loaded,
+        }
+
+# one set of subsystems per process, shared by every app the factory creates
+services = Services()
+
+def __getattr__(name):
+    """old module level names (app.db, app.chart_cache, app.render_player_charts ...) still work"""
+    if name in Services.names:
+        return getattr(services, name)
+    if name in ('render_player_charts', 'chart_data'):
+        from src import chart_renderer
+        return getattr(chart_renderer, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def collect_stats():
+    """copy pool and cache stats into gauges before /metrics renders - only for subsystems already built"""
+    db = services.loaded('db')
+    for stat, value in ((db.pool_stats() if db is not None else None) or {}).items():
+        if isinstance(value, (int, float)):
+            POOL_STATS.set(value, stat)
+    for cache_name, attribute in (('charts', 'chart_cache'), ('chart_data', 'chart_data_cache'), ('quotes', 'quote_cache')):
+        cache = services.loaded(attribute)
+        if cache is None:
+            continue
+        for stat, value in cache.stats().items():
+            CACHE_STATS.set(value, cache_name, stat)
+
+registry.on_collect(collect_stats)
+
+# every route lives on this blueprint - create_app() registers it
+bp = Blueprint('golf', __name__)
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+def record_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, response.status_code)
+    return response
+
+def create_app(preload=None):
+    """build the Flask app - cheap, subsystems load lazily
+    preload=True loads the model and weather before returning, so under a pre-forking server
+    (gunicorn --preload "src.app:create_app(preload=True)") workers start warm and share the
+    loaded memory copy on write. defaults to the GOLF_PRELOAD environment variable"""
+    if preload is None:
+        preload = os.environ.get('GOLF_PRELOAD', '') == '1'
+
+    app = Flask(__name__)
+    app.secret_key = 'test' # need secret key for this to work
+    app.before_request(start_timer)
+    app.after_request(record_latency)
+    app.register_blueprint(bp)
+
+    if preload:
+        services.warm_up()
+        # workers open their own connections - don't hand them the parent's sockets
+        database.close_pools()
+        # keep everything loaded so far out of the collector's reach, so gc in the workers
+        # doesn't write to (and copy) the shared pages
+        gc.freeze()
+
+    return app
+
+@bp.route('/ready')
+def ready():
+    """readiness probe - 200 once the model and weather are loaded and the database answers
+    a cold worker starts warming up in the background and answers 503 until it's done"""
+    status = services.status()
+    status['database'] = services.db.execute_query("SELECT 1 AS ok") is not None
+    status['ready'] = status['database'] and status['model_version'] is not None and status['weather_loaded']
+
+    if not status['ready']:
+        services.warm_up_in_background()
+        if services.warm_error:
+            status['error'] = services.warm_error
+        return jsonify(status), 503
+    return jsonify(status)
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/', methods=['GET', 'POST'])
 def index():
     """homepage"""
     if request.method == 'POST':
         # get player name on home page
         player_name = request.form['player_name']
         player_name = player_name.strip().title() # capitalize first letters of name
-        return redirect(url_for('player_dashboard', name=player_name))
+        return redirect(url_for('.player_dashboard', name=player_name))
 
     return render_template('index.html')
 
-@app.route('/player/<name>')
+@bp.route('/player/<name>')
 def player_dashboard(name):
     """dashboard for existing players"""
-    # check if player exists
-    player_query = "SELECT player_id, handicap FROM players WHERE player_name = %s"
-    player_result = db.execute_query(player_query, (name,))
+    # check if player exists - id, handicap and round history version in one query
+    context = services.db.get_player_context(name)
 
-    if player_result:
+    if context:
         # existing player
-        player_id = player_result[0]['player_id']
-        handicap = player_result[0]['handicap']
+        player_id = context['player_id']
+        handicap = context['handicap']
         is_new_player = False
 
-        # get performance charts for existing player
-        charts = generate_player_charts(player_id)
+        # get performance charts for existing player - None while they're still being drawn
+        charts = generate_player_charts(player_id, version=(context['round_count'], context['latest_round_id']))
+        charts_pending = charts is None and context['round_count'] > 0
     else:
         # new player
         player_id = None
         handicap = None
         is_new_player = True
         charts = None
+        charts_pending = False
 
     return render_template('dashboard.html',
                            player_name=name,
                            player_id=player_id,
                            handicap=handicap,
                            is_new_player=is_new_player,
-                           charts=charts)
-
-@app.route('/book', methods=['POST'])
+                           charts=charts,
+                           charts_pending=charts_pending)
+
+@bp.route('/player/<name>/charts')
+def player_charts(name):
+    """rendered charts as JSON - the dashboard polls this while charts are being drawn"""
+    context = services.db.get_player_context(name)
+    if not context:
+        return jsonify({'error': f"player '{name}' not found"}), 404
+
+    charts = generate_player_charts(context['player_id'],
+                                    version=(context['round_count'], context['latest_round_id']))
+    if charts is None and context['round_count'] > 0:
+        return jsonify({'ready': False}), 202
+    return jsonify({'ready': True, 'charts': charts})
+
+@bp.route('/player/<name>/chart-data')
+def player_chart_data(name):
+    """round history points for browser drawn charts, downsampled to at most max_points per chart"""
+    try:
+        max_points = int(request.args.get('max_points', 500))
+    except ValueError:
+        return jsonify({'error': 'max_points must be a number'}), 400
+    max_points = min(max(max_points, 3), MAX_CHART_POINTS)
+
+    context = services.db.get_player_context(name)
+    if not context:
+        return jsonify({'error': f"player '{name}' not found"}), 404
+
+    player_id = context['player_id']
+    version = (context['round_count'], context['latest_round_id'])
+    data = services.chart_data_cache.get((player_id, max_points), version)
+    if data is None:
+        from src.chart_renderer import chart_data
+        data = chart_data(get_round_history(player_id) or [], max_points=max_points)
+        services.chart_data_cache.put((player_id, max_points), version, data)
+
+    return jsonify(data)
+
+@bp.route('/book', methods=['POST'])
 def make_booking():
     """booking system"""
     # get players name from home page
@@ -87,19 +336,28 @@ def make_booking():
         handicap = float(request.form['handicap'])
         # add new player to database
         insert_player_query = "INSERT INTO players (player_name, handicap) VALUES (%s, %s) RETURNING player_id"
-        db.execute_query(insert_player_query, (player_name, handicap))
+        result = services.db.execute_query(insert_player_query, (player_name, handicap))
+        if not result:
+            flash("Booking failed: could not create player", 'error')
+            return redirect(url_for('.player_dashboard', name=player_name))
+        player_id = result[0]['player_id']
+        round_count = 0
     else:
-        # get existing player's handicap
-        player_query = "SELECT handicap FROM players WHERE player_name = %s"
-        result = db.execute_query(player_query, (player_name,))
-        handicap = result[0]['handicap']
+        # get existing player's id, handicap and round count in one query
+        context = services.db.get_player_context(player_name)
+        if not context:
+            flash(f"Booking failed: player '{player_name}' not found", 'error')
+            return redirect(url_for('.player_dashboard', name=player_name))
+        player_id = context['player_id']
+        handicap = context['handicap']
+        round_count = context['round_count']
 
     # get weather data for the date
     weather_features = get_weather_for_date(date)
 
     # create features for prediction
     day_of_week = datetime.strptime(date, '%Y-%m-%d').weekday()
-    round_number = get_player_round_count(player_name) + 1
+    round_number = round_count + 1
 
     # features array for score predictor
     features = [
@@ -113,25 +371,90 @@ def make_booking():
 
     try:
         # create booking, predict score and get price
-        booking_id, predicted_score, price = booking_system.create_booking(
+        booking_id, predicted_score, price = services.booking_system.create_booking(
             name=player_name,
             date=date,
             tee_time_hour=time_hour,
             cart=cart,
-            features=features
+            features=features,
+            player_id=player_id
         )
 
         # show user success flash - gives them the price they'll pay and their predicted score for the round
         flash(f"Booking confirmed! Cost: ${price}. Predicted score: {predicted_score}", 'success')
-        return redirect(url_for('player_dashboard', name=player_name))
+        return redirect(url_for('.player_dashboard', name=player_name))
 
     except Exception as e:
         flash(f"Booking failed: {str(e)}", 'error')
-        return redirect(url_for('player_dashboard', name=player_name))
+        return redirect(url_for('.player_dashboard', name=player_name))
+
+
+@bp.route('/player/<name>/quote')
+def tee_sheet_quote(name):
+    """price and predicted score for every tee time in a date range, with and without a cart"""
+    try:
+        start = datetime.strptime(request.args.get('start', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else start + timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+
+    if end < start or (end - start).days >= MAX_QUOTE_DAYS:
+        return jsonify({'error': f'date range must be 1 to {MAX_QUOTE_DAYS} days'}), 400
+
+    context = services.db.get_player_context(name)
+    if not context:
+        return jsonify({'error': f"player '{name}' not found"}), 404
+
+    # handicap or a new round changes the quote - weather reloads clear the whole cache
+    cache_key = (context['player_id'], start, end)
+    version = (context['handicap'], context['round_count'])
+
+    quote = services.quote_cache.get(cache_key, version)
+    if quote is None:
+        weather = services.weather_store.lookup_range(start, end)
+        quote = {
+            'player_name': name,
+            'handicap': context['handicap'],
+            'dates': services.booking_system.quote_tee_sheet(
+                round_number=context['round_count'] + 1,
+                handicap=context['handicap'],
+                weather=weather,
+                hours=TEE_TIME_HOURS
+            ),
+        }
+        services.quote_cache.put(cache_key, version, quote)
+
+    return jsonify(quote)
+
+def get_round_history_version(player_id):
+    """cheap version of a player's round history - changes whenever a round is added or removed"""
+    version_query = """
+        SELECT COUNT(*) AS round_count, MAX(round_id) AS latest_round_id
+        FROM rounds
+        WHERE player_id = %s
+    """
+    result = services.db.execute_query(version_query, (player_id,))
+
+    if not result:
+        return None
+    return result[0]['round_count'], result[0]['latest_round_id']
+
+def generate_player_charts(player_id, version=None):
+    """performance charts for existing players - served from cache when history is unchanged
+    version is (round count, latest round id), looked up if not passed in.
+    returns None while the charts are being drawn"""
+    if version is None:
+        version = get_round_history_version(player_id)
+
+    # no rounds yet - nothing to chart
+    if version is None or version[0] == 0:
+        return None
 
+    # drawn in a worker process - None until the first render for this version finishes
+    return services.chart_renderer.get(player_id, version, lambda: get_round_history(player_id))
 
-def generate_player_charts(player_id):
-    """generate performance charts for existing players"""
+def get_round_history(player_id):
+    """player's rounds with weather, oldest first"""
     # get player's round history from SQL
     rounds_query = """
         SELECT r.score, r.round_date, w.avg_temp, w.wind_speed, w.precipitation
@@ -141,93 +464,22 @@ def generate_player_charts(player_id):
         ORDER BY r.round_date
     """
 
-    rounds_data = db.execute_query(rounds_query, (player_id,))
-
-    # early exit if playerh as no round data - will not show dashboard
-    if not rounds_data:
-        return None
-
-    # convert to df
-    df = pd.DataFrame(rounds_data)
-
-    charts = {} # initialize charts dict
-
-    # Score trend over time plot
-    plt.figure(figsize=(10, 6))
-    plt.plot(pd.to_datetime(df['round_date']), df['score'], marker='o')
-    plt.title('Score Trend Over Time')
-    plt.xlabel('Date')
-    plt.ylabel('Score')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    # convert to image
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    charts['score_trend'] = base64.b64encode(img_buffer.getvalue()).decode()
-    plt.close()
-
-    # Weather vs Score analysis subplots
-    plt.figure(figsize=(12, 4))
-
-    # temp vs score
-    plt.subplot(1, 3, 1)
-    plt.scatter(df['avg_temp'], df['score'])
-    plt.xlabel('Temperature')
-    plt.ylabel('Score')
-    plt.title('Temperature vs Score')
-
-    # wind vs score
-    plt.subplot(1, 3, 2)
-    plt.scatter(df['wind_speed'], df['score'])
-    plt.xlabel('Wind Speed')
-    plt.ylabel('Score')
-    plt.title('Wind vs Score')
-
-    # rain vs score
-    plt.subplot(1, 3, 3)
-    plt.scatter(df['precipitation'], df['score'])
-    plt.xlabel('Precipitation')
-    plt.ylabel('Score')
-    plt.title('Rain vs Score')
-
-    plt.tight_layout()
-
-    # convert to image
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    charts['weather_analysis'] = base64.b64encode(img_buffer.getvalue()).decode()
-    plt.close()
-
-    return charts
+    return services.db.execute_query(rounds_query, (player_id,))
 
 def get_weather_for_date(date):
-    """get weather data for the tee time date"""
-    # query weather data from SQL
-    weather_query = "SELECT avg_temp, precipitation, wind_speed FROM weather WHERE date = %s"
-    result = db.execute_query(weather_query, (date,))
+    """get weather data for the tee time date - from memory, monthly average if the date isn't loaded"""
+    weather = services.weather_store.lookup(date)
 
     # output weather features
     return {
-            'avg_temp': result[0]['avg_temp'],
-            'precipitation': result[0]['precipitation'],
-            'wind_speed': result[0]['wind_speed']
+            'avg_temp': weather['avg_temp'],
+            'precipitation': weather['precipitation'],
+            'wind_speed': weather['wind_speed']
         }
 
-def get_player_round_count(player_name):
-    """get number of rounds played by player"""
-    # query round count from db for player
-    count_query = """
-        SELECT COUNT(*) as round_count 
-        FROM rounds r 
-        JOIN players p ON r.player_id = p.player_id 
-        WHERE p.player_name = %s
-    """
-    result = db.execute_query(count_query, (player_name,))
-
-    return result[0]['round_count'] if result else 0
+# module level app for `python app.py` and servers pointed at src.app:app - never preloaded, so
+# importing this module stays cheap even with GOLF_PRELOAD set. preload through create_app() instead
+app = create_app(preload=False)
 
 if __name__ == '__main__':
     app.run()
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Chart Cache
+    Used by Flask application to avoid redrawing player charts
+
+Charts are keyed by player id and a version of the player's round history
+(round count + latest round_id). Any new round changes the version, so stale
+charts are never served
+"""
+from src.versioned_cache import VersionedLRUCache
+
+
+class ChartCache(VersionedLRUCache):
+    """player_id -> rendered charts, sized by their base64 strings"""
+
+    @staticmethod
+    def _value_size(charts):
+        """approximate memory used by charts dict (base64 strings)"""
+        if not charts:
+            return 0
+        return sum(len(image) for image in charts.values())
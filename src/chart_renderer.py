@@ -0,0 +1,221 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Chart Renderer
+    Used by Flask application to draw player charts off the request thread
+
+Charts are drawn in a small process pool with matplotlib's object API (no
+pyplot global state), so a render never blocks a request or holds its GIL.
+Requests for the same player and history version share one render job. While
+a chart is being drawn the dashboard gets None and shows a placeholder.
+chart_data() returns downsampled points instead, for charts drawn in the browser
+"""
+import base64
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _figure_png(fig):
+    """encode a figure as a base64 png string"""
+    img_buffer = io.BytesIO()
+    fig.savefig(img_buffer, format='png')
+    return base64.b64encode(img_buffer.getvalue()).decode()
+
+
+def render_player_charts(rounds_data):
+    """draw score trend and weather charts from round history rows (list of dicts or dict of columns)"""
+    # imported here so the web process only loads matplotlib if it renders in process
+    from matplotlib.figure import Figure
+
+    # convert to df
+    df = pd.DataFrame(rounds_data)
+
+    charts = {} # initialize charts dict
+
+    # Score trend over time plot
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    ax.plot(pd.to_datetime(df['round_date']), df['score'], marker='o')
+    ax.set_title('Score Trend Over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Score')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    charts['score_trend'] = _figure_png(fig)
+
+    # Weather vs Score analysis subplots
+    fig = Figure(figsize=(12, 4))
+    for position, (column, label, title) in enumerate([
+        ('avg_temp', 'Temperature', 'Temperature vs Score'),
+        ('wind_speed', 'Wind Speed', 'Wind vs Score'),
+        ('precipitation', 'Precipitation', 'Rain vs Score'),
+    ], start=1):
+        ax = fig.add_subplot(1, 3, position)
+        ax.scatter(df[column], df['score'])
+        ax.set_xlabel(label)
+        ax.set_ylabel('Score')
+        ax.set_title(title)
+    fig.tight_layout()
+    charts['weather_analysis'] = _figure_png(fig)
+
+    return charts
+
+
+def downsample_trend(x, y, max_points):
+    """largest triangle three buckets - keeps the points that shape the line, first and last always kept
+    returns indices into x/y"""
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    # first and last points are fixed, the rest are split into equal buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = [0]
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # average of the next bucket (or the last point) is the third triangle corner
+        if bucket + 2 < len(edges):
+            next_x = x[end:edges[bucket + 2]].mean()
+            next_y = y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        previous = selected[-1]
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        selected.append(start + int(np.argmax(area)))
+    selected.append(n - 1)
+
+    return np.array(selected)
+
+
+def chart_data(rounds_data, max_points=500):
+    """points for browser drawn charts - trend downsampled with LTTB, scatter with an even stride"""
+    df = pd.DataFrame(rounds_data)
+    if df.empty:
+        return {'rounds': 0, 'score_trend': [], 'weather_analysis': []}
+
+    dates = pd.to_datetime(df['round_date'])
+    scores = df['score'].to_numpy(dtype=float)
+
+    keep = downsample_trend(dates.to_numpy(dtype='int64').astype(float), scores, max_points)
+    trend = [{'date': dates.iloc[i].strftime('%Y-%m-%d'), 'score': int(scores[i])} for i in keep]
+
+    # scatter plots show spread, not order - every k-th round keeps the distribution
+    stride = max(1, -(-len(df) // max_points))
+    sample = df.iloc[::stride]
+    weather = [
+        {
+            'score': int(row.score),
+            'avg_temp': None if pd.isna(row.avg_temp) else float(row.avg_temp),
+            'wind_speed': None if pd.isna(row.wind_speed) else float(row.wind_speed),
+            'precipitation': None if pd.isna(row.precipitation) else float(row.precipitation),
+        }
+        for row in sample.itertuples()
+    ]
+
+    return {'rounds': len(df), 'score_trend': trend, 'weather_analysis': weather}
+
+
+def _pool_context():
+    """forkserver where available - workers fork from a clean process with this module preloaded,
+    not from the threaded web server, and without re-running app.py the way spawn would"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['src.chart_renderer'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class ChartRenderer:
+    def __init__(self, cache, max_workers=2, max_pending=64):
+        self.cache = cache # ChartCache finished charts go into
+        self.max_workers = max_workers
+        self.max_pending = max_pending # jobs queued or running before new ones are turned away
+        self._executor = None
+        self._pending = {} # (player_id, version) -> future
+        self._latest = {} # player_id -> newest version asked for - older renders aren't cached over it
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        """process pool, started on first use"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context())
+            return self._executor
+
+    def get(self, player_id, version, load_rounds):
+        """charts if they're ready, else start a render (once per player and version) and return None
+        load_rounds() fetches the round history and is only called when a render is needed"""
+        with self._lock:
+            self._latest[player_id] = version
+
+        charts = self.cache.get(player_id, version)
+        if charts is not None:
+            return charts
+
+        key = (player_id, version)
+        with self._lock:
+            if key in self._pending or len(self._pending) >= self.max_pending:
+                return None
+            self._pending[key] = None # claim the job before loading rows outside the lock
+
+        try:
+            rounds_data = load_rounds()
+            if not rounds_data:
+                with self._lock:
+                    self._pending.pop(key, None)
+                return None
+
+            # columns pickle much smaller than a list of row dicts
+            columns = {name: [row[name] for row in rounds_data] for name in rounds_data[0]}
+            future = self._pool().submit(render_player_charts, columns)
+        except Exception:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+
+        with self._lock:
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return None
+
+    def _finished(self, key, future):
+        """store a finished render - failed renders are dropped so the next request retries, and a
+        render that finishes after a newer version was asked for is dropped instead of replacing it"""
+        try:
+            charts = future.result()
+            with self._lock:
+                current = self._latest.get(key[0]) == key[1]
+            if current:
+                self.cache.put(key[0], key[1], charts) # cached before the job stops being pending
+        except Exception as e:
+            print(f"Chart render failed for player {key[0]}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def wait(self, player_id, version, timeout=None):
+        """block until a pending render finishes - for scripts and benchmarks, not requests"""
+        with self._lock:
+            future = self._pending.get((player_id, version))
+        if future is not None:
+            return future.result(timeout=timeout)
+        return self.cache.get(player_id, version)
+
+    def stats(self):
+        """jobs in flight"""
+        with self._lock:
+            return {'pending': len(self._pending), 'max_pending': self.max_pending, 'workers': self.max_workers}
+
+    def shutdown(self):
+        """stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -7,14 +7,21 @@ PySpark ETL pipeline & advanced features
 
 Requirements:
     -golf csv and weather csv
-    -both need to be present in data/raw for ETL to work
+    -both need to be present in data/raw for the first ETL run
     -golf_analytics db created as well as tables
-Duplicate weather and player records are not loaded, but round record are
+Duplicate weather, player and round records are not loaded - rounds are keyed by player, date,
+round index and source row, so reloading a file only inserts rounds that aren't already there
+Raw files are tracked in data/processed/ingest_manifest.json - only new or changed files are loaded
+New raw files are staged once to parquet in data/staged and the pipeline reads the parquet
+Round stats (round numbers, rounds played, handicap) are maintained by statement level triggers
+Round dates are a seeded hash of the raw row (date_seed), so reloading the same files gives the same dates
+Manifest handling and stage timing are shared with the pandas engine (etl_engine, local_engine)
 """
 import sys
 import os
 import random
-import glob
+import time
+import uuid
 import findspark
 import platform
 
@@ -53,9 +60,51 @@ from pyspark.sql.functions import *
 from pyspark.sql.types import *
 from pyspark.sql.window import Window
 from scripts import conversions
-
-class DataProcessor:
-    def __init__(self):
+from src.database import DatabaseManager
+from src.etl_engine import EtlProcessor, ROUND_COLUMNS, WEATHER_START_DATE
+
+# declared schemas for raw csvs - no inferSchema pass over the files
+# golf files only need their leading columns, anything after Open.R4 is dropped when parsed
+GOLF_RAW_SCHEMA = StructType([
+    StructField("Year", IntegerType()),
+    StructField("Name", StringType()),
+    StructField("Course", StringType()),
+    StructField("Yards", IntegerType()),
+    StructField("Par", IntegerType()),
+    StructField("Open.Position", StringType()),
+    StructField("Integer.Position", IntegerType()),
+    StructField("Position.Grouping", IntegerType()),
+    StructField("Open.R1", IntegerType()),
+    StructField("Open.R2", IntegerType()),
+    StructField("Open.R3", IntegerType()),
+    StructField("Open.R4", IntegerType()),
+])
+
+WEATHER_RAW_SCHEMA = StructType([
+    StructField("time", DateType()),
+    StructField("tavg", DoubleType()),
+    StructField("tmin", DoubleType()),
+    StructField("tmax", DoubleType()),
+    StructField("prcp", DoubleType()),
+    StructField("wdir", DoubleType()),
+    StructField("wspd", DoubleType()),
+    StructField("pres", DoubleType()),
+])
+
+class DataProcessor(EtlProcessor):
+    engine = 'spark'
+
+    # how each table is written - "jdbc" (spark row inserts) or "copy" (postgres COPY via staging table)
+    default_write_backends = {
+        'players': 'jdbc',
+        'weather': 'jdbc',
+        'rounds': 'jdbc',
+    }
+
+    # always merged through a staging table, whatever the backend, so rounds already loaded are skipped
+    staged_tables = ('rounds',)
+
+    def __init__(self, write_backends=None, date_seed=5110):
         # absolute path to JDBC driver
         current_dir = os.path.dirname(os.path.abspath(__file__))
         jdbc_driver_path = os.path.join(current_dir, "..", "lib", "postgresql-42.3.1.jar")
@@ -73,12 +122,29 @@ class DataProcessor:
 
         # database connection properties
         self.jdbc_props = {
-            "url": "jdbc:postgresql://localhost:5432/golf_analytics",
+            # rewrite JDBC batches into multi row INSERTs so the statement level triggers on rounds
+            # run once per batch instead of once per row
+            "url": "jdbc:postgresql://localhost:5432/golf_analytics?reWriteBatchedInserts=true",
             "driver": "org.postgresql.Driver",
             "user": "golf_user",
             "password": "golf_password"
         }
 
+        super().__init__(date_seed=date_seed)
+
+        # run scoped cache of reference tables - each is read from the db once per run
+        self._dimensions = {}
+
+        # per table write backend, e.g. DataProcessor(write_backends={'rounds': 'copy'})
+        self.write_backends = dict(self.default_write_backends)
+        for table, backend in (write_backends or {}).items():
+            if backend not in ('jdbc', 'copy'):
+                raise ValueError(f"Unknown write backend for {table}: {backend}")
+            self.write_backends[table] = backend
+
+        # driver side SQL (COPY staging/merge) goes through the shared connection pool
+        self.db = DatabaseManager()
+
         # test connection
         if not self.test_connection():
             raise Exception("Failed to connect to database")
@@ -107,70 +173,171 @@ class DataProcessor:
             print(f"Database connection failed: {e}")
             return False
 
-    def extract_raw_data(self):
-        """get raw data from files using glob"""
-        # set paths
-        raw_directory = "../data/raw/"
-        golf_pattern = f"{raw_directory}golf*.csv"
-        weather_pattern = f"{raw_directory}boston_weather_data.csv"
+    # columns needed from each reference table - only these are pulled over JDBC
+    dimension_columns = {
+        'players': ['player_id', 'player_name'],
+        'weather': ['date'],
+    }
 
-        # get files from paths
-        golf_files = glob.glob(golf_pattern)
-        weather_files = glob.glob(weather_pattern)
-
-        # let user know how many files we found
-        print(f"Found {len(golf_files)} golf files")
-        print(f"Found {len(weather_files)} weather files")
-
-        if golf_files and weather_files: # if both files found
-            # only use the first file found for each type
-            golf_file = golf_files[0]
-            weather_file = weather_files[0]
-
-            # let user know file being read
-            print(f"Using golf file: {golf_file}")
-            print(f"Using weather file: {weather_file}")
+    def _read_query(self, query, alias):
+        """read the result of a query over JDBC - the query runs inside postgres"""
+        return self.spark.read \
+            .format("jdbc") \
+            .option("url", self.jdbc_props["url"]) \
+            .option("dbtable", f"({query}) AS {alias}") \
+            .option("user", self.jdbc_props["user"]) \
+            .option("password", self.jdbc_props["password"]) \
+            .option("driver", self.jdbc_props["driver"]) \
+            .load()
 
-            # read data from raw files into spark dfs and return them
-            df_golf_raw = self.spark.read.csv(golf_file, header=True, inferSchema=True)
-            df_weather_raw = self.spark.read.csv(weather_file, header=True, inferSchema=True)
+    def count_table(self, table):
+        """row count computed by postgres instead of loading the table into spark"""
+        result = self._read_query(f"SELECT COUNT(*) AS row_count FROM {table}", f"{table}_count").collect()
+        return int(result[0]['row_count'])
+
+    def get_dimension(self, table):
+        """cached reference table (players or weather) with only the needed columns"""
+        if table not in self._dimensions:
+            columns = ", ".join(self.dimension_columns[table])
+            dimension = self._read_query(f"SELECT {columns} FROM {table}", f"{table}_dim").cache()
+            self._dimensions[table] = dimension
+
+        return self._dimensions[table]
+
+    def _extend_dimension(self, table, new_rows):
+        """add newly inserted rows to a cached reference table instead of re-reading it"""
+        old = self.get_dimension(table)
+        updated = old.unionByName(new_rows.select(*self.dimension_columns[table])).cache()
+        updated.count() # materialize before dropping the old copy
+        old.unpersist()
+        self._dimensions[table] = updated
+        return updated
+
+    def clear_dimension_cache(self):
+        """drop cached reference tables - call at the end of a run"""
+        for dimension in self._dimensions.values():
+            dimension.unpersist()
+        self._dimensions = {}
+
+    def _shuffle_bytes(self):
+        """total shuffle read/write bytes so far from the spark monitoring api - None if the ui is off"""
+        ui_url = self.spark.sparkContext.uiWebUrl
+        if not ui_url:
+            return None
+        try:
+            response = requests.get(
+                f"{ui_url}/api/v1/applications/{self.spark.sparkContext.applicationId}/stages",
+                timeout=5
+            )
+            response.raise_for_status()
+            stages = response.json()
+        except (requests.RequestException, ValueError):
+            return None
+
+        return (sum(stage.get("shuffleReadBytes", 0) for stage in stages),
+                sum(stage.get("shuffleWriteBytes", 0) for stage in stages))
+
+    def extract_raw_data(self, force=False):
+        """get new or changed raw data files using glob and the ingestion manifest
+        returns None for a dataset with nothing new to load. force=True reloads every file"""
+        new_golf_files, new_weather_files = self._pending_raw_files(force)
+        if new_golf_files is None:
+            return None, None
 
-            return df_golf_raw, df_weather_raw
+        # convert every new file of each type to parquet in a single spark read, then read the parquet back
+        df_golf_raw = None
+        if new_golf_files:
+            self.stage_raw_files(golf_files=new_golf_files)
+            new_sources = [os.path.basename(path) for path in new_golf_files]
+            # partition filter - only the files staged in this run are scanned
+            df_golf_raw = self.load_staged("golf", where=col("source_file").isin(new_sources))
+        else:
+            print("No new golf files to process")
 
-        # conditions for if one or no files are in the raw directory
-        elif golf_files and not weather_files:
-            print("Golf files found, but no weather files")
-            return None, None
-        elif not golf_files and weather_files:
-            print("Weather files found, but no golf files")
-            return None, None
+        df_weather_raw = None
+        if new_weather_files:
+            self.stage_raw_files(weather_files=new_weather_files)
+            df_weather_raw = self.load_staged("weather")
         else:
-            print("No files found")
-            return None, None
+            print("No new weather files to process")
+
+        return df_golf_raw, df_weather_raw
+
+    def stage_raw_files(self, golf_files=None, weather_files=None):
+        """convert raw csvs to partitioned parquet using the declared schemas
+        re-staging a file replaces only its own partitions"""
+        if golf_files:
+            print(f"Staging {len(golf_files)} golf files to parquet")
+            self.spark.read.csv(golf_files, header=True, schema=GOLF_RAW_SCHEMA) \
+                .withColumn("source_file", col("_metadata.file_name")) \
+                .write \
+                .mode("overwrite") \
+                .option("partitionOverwriteMode", "dynamic") \
+                .partitionBy("source_file") \
+                .parquet(os.path.join(self.staged_directory, "golf"))
+
+        if weather_files:
+            print(f"Staging {len(weather_files)} weather files to parquet")
+            self.spark.read.csv(weather_files, header=True, schema=WEATHER_RAW_SCHEMA) \
+                .withColumn("year", year(col("time"))) \
+                .write \
+                .mode("overwrite") \
+                .option("partitionOverwriteMode", "dynamic") \
+                .partitionBy("year") \
+                .parquet(os.path.join(self.staged_directory, "weather"))
+
+    def load_staged(self, dataset, columns=None, where=None):
+        """read staged parquet ("golf" or "weather")
+        columns and where are pushed down to the parquet scan"""
+        df = self.spark.read.parquet(os.path.join(self.staged_directory, dataset))
+
+        if where is not None:
+            df = df.where(where)
+        if columns is not None:
+            df = df.select(*[f"`{c}`" for c in columns])
+
+        return df
 
     def clean_golf_data(self, df_golf_raw):
         """clean golf data - reshape data"""
+        rounds = [f'`{r}`' for r in ROUND_COLUMNS]
+
+        # identity of each raw row - the round dates are derived from it, so reruns give the same dates
+        key_columns = [c for c in ['source_file', 'Year', 'Course'] if c in df_golf_raw.columns]
+        row_key = concat_ws("|", *[col(f"`{c}`").cast("string") for c in ['Name'] + key_columns],
+                            *[col(r).cast("string") for r in rounds])
+
+        # raw file of each row - part of the rounds natural key
+        source_file = col("source_file") if "source_file" in key_columns else lit(None).cast("string")
+
         # get necessary columns from raw df and pivot the round data
-        df_golf = df_golf_raw.select('Name', '`Open.R1`', '`Open.R2`', '`Open.R3`', '`Open.R4`') \
-            .filter(col('Name').isNotNull()) \
+        df_golf = df_golf_raw.filter(col('Name').isNotNull()) \
+            .withColumn("row_key", row_key) \
+            .withColumn("source_file", source_file) \
+            .select('Name', 'row_key', 'source_file', *rounds) \
             .unpivot(
-            ids=['Name'],
-            values=['`Open.R1`', '`Open.R2`', '`Open.R3`', '`Open.R4`'],
+            ids=['Name', 'row_key', 'source_file'],
+            values=rounds,
             variableColumnName='Round',
             valueColumnName='Score'
         ) \
-            .withColumn("round_number", # this is a placeholder and rounds will be accumulated later by date
+            .withColumn("round_index", # raw round 1-4, kept for the natural key. round_number is a placeholder renumbered by date later
                         when(col("Round") == "Open.R1", 1)
                         .when(col("Round") == "Open.R2", 2)
                         .when(col("Round") == "Open.R3", 3)
                         .when(col("Round") == "Open.R4", 4)) \
+            .withColumn("round_number", col("round_index")) \
             .withColumn("player_name", col("Name")) \
-            .drop("Round", "Name")
+            .withColumn("source_key", xxhash64(col("row_key")))
 
         # add dates to records to be paired with weather records
-        df_golf_with_dates = df_golf.withColumn("random_year", floor(rand() * 6) + 2017) \
-            .withColumn("random_month", floor(rand() * 7) + 4) \
-            .withColumn("random_day", floor(rand() * 28) + 1) \
+        # seeded hash of the row instead of rand() - same dates on every run and any partitioning
+        def seeded_pick(offset, choices):
+            return pmod(xxhash64(col("row_key"), col("Round"), lit(self.date_seed + offset)), lit(choices))
+
+        df_golf_with_dates = df_golf.withColumn("random_year", seeded_pick(0, 6) + 2017) \
+            .withColumn("random_month", seeded_pick(1, 7) + 4) \
+            .withColumn("random_day", seeded_pick(2, 28) + 1) \
             .withColumn("round_date",
                         to_date(concat(
                             col("random_year"),
@@ -179,7 +346,7 @@ class DataProcessor:
                             lit("-"),
                             lpad(col("random_day"), 2, "0")
                         ), "yyyy-MM-dd")) \
-            .drop("random_year", "random_month", "random_day")
+            .drop("random_year", "random_month", "random_day", "Round", "Name", "row_key")
 
         return df_golf_with_dates # return cleaned df
 
@@ -193,55 +360,126 @@ class DataProcessor:
             .withColumn("day_of_week", date_format(col("date"), "EEEE")) \
             .withColumn("day_of_week_int", dayofweek(col("date"))) \
             .select("date", "avg_temp", "precipitation", "wind_speed", "day_of_week", "day_of_week_int") \
-            .filter(col('date') >= '2017-04-01') \
+            .filter(col('date') >= WEATHER_START_DATE) \
             .filter(col('date').isNotNull()) \
             .dropDuplicates(["date"])
 
         return df_weather # return cleaned df
 
+    def write_table(self, df, table, row_count):
+        """append df to a table with the backend chosen for it and report rows per second"""
+        backend = self.write_backends[table]
+        start = time.perf_counter()
+
+        inserted = None
+        if backend == 'copy' or table in self.staged_tables:
+            inserted = self._write_staged(df, table, backend)
+        else:
+            self._write_jdbc(df, table)
+
+        self._record_write(table, backend, row_count, time.perf_counter() - start, inserted)
+
+    def _write_jdbc(self, df, table):
+        """spark JDBC append - batched INSERTs"""
+        df.write \
+            .format("jdbc") \
+            .option("url", self.jdbc_props["url"]) \
+            .option("dbtable", table) \
+            .option("user", self.jdbc_props["user"]) \
+            .option("password", self.jdbc_props["password"]) \
+            .option("driver", "org.postgresql.Driver") \
+            .option("batchsize", 10000) \
+            .mode("append") \
+            .save()
+
+    def _write_staged(self, df, table, backend):
+        """load df into an unlogged staging table - each partition streamed with COPY in parallel,
+        or spark JDBC inserts - then merge it into the target with one INSERT ... SELECT
+        returns the number of rows the merge inserted"""
+        columns = df.columns
+        column_list = ", ".join(columns)
+        staging_table = f"staging_{table}_{uuid.uuid4().hex[:12]}"
+        connection_params = dict(self.db.connection_params)
+
+        # staging table is a real (unlogged) table so every partition's connection can see it
+        with self.db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE UNLOGGED TABLE {staging_table} (LIKE {table} INCLUDING DEFAULTS)")
+            conn.commit()
+
+        def copy_partition(rows):
+            # runs on the executors - imports kept local so spark ships this function by value
+            import csv
+            import io
+            import psycopg2
+
+            copy_sql = f"COPY {staging_table} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+            chunk_rows = 50000
+
+            conn = psycopg2.connect(**connection_params)
+            try:
+                with conn.cursor() as cur:
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    pending = 0
+                    for row in rows:
+                        writer.writerow(row) # None becomes an empty unquoted field, which COPY reads as NULL
+                        pending += 1
+                        if pending == chunk_rows: # send in chunks to keep memory flat
+                            buffer.seek(0)
+                            cur.copy_expert(copy_sql, buffer)
+                            buffer = io.StringIO()
+                            writer = csv.writer(buffer)
+                            pending = 0
+                    if pending:
+                        buffer.seek(0)
+                        cur.copy_expert(copy_sql, buffer)
+                conn.commit()
+            finally:
+                conn.close()
+
+        try:
+            if backend == 'copy':
+                df.foreachPartition(copy_partition)
+            else:
+                self._write_jdbc(df, staging_table)
+
+            with self.db.connection() as conn:
+                with conn.cursor() as cur:
+                    inserted = self._merge_staged(cur, table, staging_table, column_list)
+                conn.commit()
+        finally:
+            with self.db.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {staging_table}")
+                conn.commit()
+
+        return inserted
+
     def process_players(self, df_golf):
         """process players - insert new records only and avoid duplicates"""
         print("Processing players") # for user
 
         # Step 1: get unique players from golf data
-        unique_players = df_golf.select("player_name").distinct()
+        unique_players = df_golf.select("player_name").distinct().cache()
         unique_count = unique_players.count()
         print(f"Found {unique_count} unique players in golf data")
 
-        # Step 2: get existing players from database
-        try:
-            # connect to players table in db
-            existing_players = self.spark.read \
-                .format("jdbc") \
-                .option("url", self.jdbc_props["url"]) \
-                .option("dbtable", "players") \
-                .option("user", self.jdbc_props["user"]) \
-                .option("password", self.jdbc_props["password"]) \
-                .option("driver", "org.postgresql.Driver") \
-                .load()
-
-            existing_players_is_empty = False # variable keeping track if our table is empty
-            # get count of players in players table
-            existing_count = existing_players.count()
-            print(f"Found {existing_count} existing players in database")
+        # Step 2: get existing players from database - read once and cached for the run
+        existing_players = self.get_dimension("players")
+        existing_count = existing_players.count()
+        print(f"Found {existing_count} existing players in database")
 
-        except Exception as e:
-            # if players table is empty, let user know
-            print("No existing players found. Table empty.")
-            existing_players = None
-            existing_players_is_empty = True
+        # newest id before inserting, so only the new rows need to be read back
+        last_player_id = existing_players.agg(max("player_id").alias("last_id")).collect()[0]["last_id"] or 0
 
         # Step 3: Find new players - those not in players table
-        if not existing_players_is_empty:
-            # left join to only get non existing players
-            new_players = unique_players.join(
-                existing_players.select("player_name"),
-                on="player_name",
-                how="left_anti"  # only players NOT in table
-            )
-        else:
-            # if table is empty, all unique players are new
-            new_players = unique_players
+        # left join to only get non existing players - players table is small so broadcast it
+        new_players = unique_players.join(
+            broadcast(existing_players.select("player_name")),
+            on="player_name",
+            how="left_anti"  # only players NOT in table
+        ).cache()
 
         # get count of new players
         new_player_count = new_players.count()
@@ -253,73 +491,49 @@ class DataProcessor:
             # Step 4: insert new players into database
             try:
                 # write to db
-                new_players.write \
-                    .format("jdbc") \
-                    .option("url", self.jdbc_props["url"]) \
-                    .option("dbtable", "players") \
-                    .option("user", self.jdbc_props["user"]) \
-                    .option("password", self.jdbc_props["password"]) \
-                    .mode("append") \
-                    .option("driver", "org.postgresql.Driver") \
-                    .save()
+                self.write_table(new_players, "players", new_player_count)
 
                 print(f"Created {new_player_count} new players") # show inserted players to user
 
             except Exception as e:
                 print(f"Error creating new players: {e}")
                 raise
+
+            # Step 5: add the new players and their generated ids to the cached mapping
+            inserted_players = self._read_query(
+                f"SELECT player_id, player_name FROM players WHERE player_id > {int(last_player_id)}",
+                "new_players"
+            )
+            self._extend_dimension("players", inserted_players)
         else:
             # if all players already exist in db, do nothing
             print("All players already exist in database")
 
-        # Step 5: return updated player mapping - all players with their IDs
-        updated_players = self.spark.read \
-            .format("jdbc") \
-            .option("url", self.jdbc_props["url"]) \
-            .option("dbtable", "players") \
-            .option("user", self.jdbc_props["user"]) \
-            .option("password", self.jdbc_props["password"]) \
-            .option("driver", "org.postgresql.Driver") \
-            .load()
+        new_players.unpersist()
+        unique_players.unpersist()
 
-        final_count = updated_players.count()
+        final_count = self.count_table("players")
         print(f"Total players in database: {final_count}")
 
-        return updated_players.select("player_id", "player_name")
+        # return updated player mapping - all players with their IDs
+        return self.get_dimension("players")
 
     def import_weather_to_database(self, df_weather_cleaned):
         """import cleaned weather data to database"""
         print("Importing weather data to database")
 
         try:
-            # Step 1: check for existing weather dates to avoid duplicates
-            try:
-                # read weather data from db
-                existing_weather = self.spark.read \
-                    .format("jdbc") \
-                    .option("url", self.jdbc_props["url"]) \
-                    .option("dbtable", "weather") \
-                    .option("user", self.jdbc_props["user"]) \
-                    .option("password", self.jdbc_props["password"]) \
-                    .option("driver", "org.postgresql.Driver") \
-                    .load()
-
-                # get distinct existing dates (no dates should be duplicated)
-                existing_dates = existing_weather.select("date").distinct()
-                existing_count = existing_dates.count()
-                print(f"Found {existing_count} existing weather dates in database")
-
-            except Exception as e:
-                # if table is empty, don't crash function
-                print("No existing weather data found.")
-                existing_dates = None
+            # Step 1: check for existing weather dates to avoid duplicates - cached for the run
+            existing_dates = self.get_dimension("weather")
+            existing_count = existing_dates.count()
+            print(f"Found {existing_count} existing weather dates in database")
 
             # Step 2: filter out dates that already exist to avoid duplicates
             new_weather_data = df_weather_cleaned.join(
-                existing_dates,
+                broadcast(existing_dates),
                 on="date",
                 how="left_anti"  # only dates NOT in existing table
-            )
+            ).cache()
 
             # get counts of new records
             new_records_count = new_weather_data.count()
@@ -329,29 +543,19 @@ class DataProcessor:
                 print(f"Importing dates")
 
                 # insert new weather data
-                new_weather_data.write \
-                    .format("jdbc") \
-                    .option("url", self.jdbc_props["url"]) \
-                    .option("dbtable", "weather") \
-                    .option("user", self.jdbc_props["user"]) \
-                    .option("password", self.jdbc_props["password"]) \
-                    .mode("append") \
-                    .option("driver", "org.postgresql.Driver") \
-                    .save()
+                self.write_table(new_weather_data, "weather", new_records_count)
+
+                # dates are the key, so the cache can be updated without reading back
+                self._extend_dimension("weather", new_weather_data)
 
                 print(f"Weather data imported: {new_records_count} new records")
             else:
                 print("All weather dates already exist in database")
 
+            new_weather_data.unpersist()
+
             # Step 4: show final weather table summary to user
-            final_weather_count = self.spark.read \
-                .format("jdbc") \
-                .option("url", self.jdbc_props["url"]) \
-                .option("dbtable", "weather") \
-                .option("user", self.jdbc_props["user"]) \
-                .option("password", self.jdbc_props["password"]) \
-                .option("driver", "org.postgresql.Driver") \
-                .load().count()
+            final_weather_count = self.count_table("weather")
 
             print(f"Total weather records in database: {final_weather_count}")
 
@@ -364,71 +568,52 @@ class DataProcessor:
         print("Processing and importing rounds data...")
 
         try:
-            # Step 1: get player counts already existing in db
-            players_mapping = self.spark.read \
-                .format("jdbc") \
-                .option("url", self.jdbc_props["url"]) \
-                .option("dbtable", "players") \
-                .option("user", self.jdbc_props["user"]) \
-                .option("password", self.jdbc_props["password"]) \
-                .option("driver", "org.postgresql.Driver") \
-                .load() \
-                .select("player_id", "player_name")
+            # Step 1: get players already existing in db - from the run cache
+            players_mapping = self.get_dimension("players")
 
             print(f"Found {players_mapping.count()} players in database")
 
             # Step 2: join rounds with player IDs
             df_rounds_with_players = df_golf_cleaned.join(
-                players_mapping,
+                broadcast(players_mapping),
                 on="player_name",
                 how="inner"
             )
 
             # Step 3: verify weather data exists for all round dates
             print("Verifying weather data")
-            weather_dates = self.spark.read \
-                .format("jdbc") \
-                .option("url", self.jdbc_props["url"]) \
-                .option("dbtable", "weather") \
-                .option("user", self.jdbc_props["user"]) \
-                .option("password", self.jdbc_props["password"]) \
-                .option("driver", "org.postgresql.Driver") \
-                .load() \
-                .select("date")
+            weather_dates = self.get_dimension("weather")
 
             df_rounds_verified = df_rounds_with_players.join(
-                weather_dates,
+                broadcast(weather_dates),
                 df_rounds_with_players.round_date == weather_dates.date,
                 "inner"
             ).drop("date")
 
             # Step 5: select final columns
+            # cached so the count and the write see the same rows
             df_rounds_final = df_rounds_verified.select(
                 "player_id",
                 "player_name",
                 "round_date",
                 "score",
-                "round_number"
-            ).filter(col("score") > 0) # don't import scores of 0
+                "round_number", # placeholder - rounds are numbered by date in the database
+                "round_index",
+                "source_file",
+                "source_key"
+            ).filter(col("score") > 0).cache() # don't import scores of 0
 
             # get load count
             final_count = df_rounds_final.count()
             print(f"Rounds to import: {final_count}")
 
-            # Step 6: insert rounds - triggers will automatically calculate handicaps and other stats
+            # Step 6: insert rounds - rounds already loaded are skipped by the merge, and
+            # triggers calculate handicaps and other stats for the new ones
             if final_count > 0:
                 print("Inserting rounds")
 
                 # write to db
-                df_rounds_final.write \
-                    .format("jdbc") \
-                    .option("url", self.jdbc_props["url"]) \
-                    .option("dbtable", "rounds") \
-                    .option("user", self.jdbc_props["user"]) \
-                    .option("password", self.jdbc_props["password"]) \
-                    .option("driver", "org.postgresql.Driver") \
-                    .mode("append") \
-                    .save()
+                self.write_table(df_rounds_final, "rounds", final_count)
 
                 print(f"Rounds imported: {final_count} records")
 
@@ -440,11 +625,18 @@ class DataProcessor:
 
 
 if __name__ == "__main__":
-    # initialize processor, clean and load the data
+    # initialize processor, clean and load the new data - each step is timed into the metrics registry
     process = DataProcessor()
-    df_golf_raw, df_weather_raw = process.extract_raw_data()
-    df_golf_cleaned = process.clean_golf_data(df_golf_raw)
-    df_weather_cleaned = process.clean_weather_data(df_weather_raw)
-    process.process_players(df_golf_cleaned)
-    process.import_weather_to_database(df_weather_cleaned)
-    process.import_rounds_to_database(df_golf_cleaned)
\ No newline at end of file
+    with process.stage("extract"):
+        df_golf_raw, df_weather_raw = process.extract_raw_data()
+    if df_weather_raw is not None:
+        with process.stage("load_weather"):
+            process.import_weather_to_database(process.clean_weather_data(df_weather_raw))
+    if df_golf_raw is not None:
+        df_golf_cleaned = process.clean_golf_data(df_golf_raw)
+        with process.stage("load_players"):
+            process.process_players(df_golf_cleaned)
+        with process.stage("load_rounds"):
+            process.import_rounds_to_database(df_golf_cleaned)
+    process.mark_files_ingested()
+    process.clear_dimension_cache()
@@ -4,14 +4,175 @@ DS5110 - Final Project - Golf Course Manager
 
 Database Manager
     Used for accessing database throughout the project
+
+Connections are pooled by default. Every DatabaseManager in a process with the
+same connection settings shares one pool, so app.py, RoundBooking and the scripts
+reuse connections instead of opening a new one per query
 """
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from sqlalchemy import create_engine
+from psycopg2 import pool as pg_pool
+from contextlib import contextmanager
+import threading
+import time
 import os
+from src.metrics import registry, fingerprint
+
+QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "Query time including connection borrow, by statement fingerprint", ("statement",))
+QUERY_ERRORS = registry.counter("db_query_errors_total", "Failed queries by statement fingerprint", ("statement",))
+
+# one pool per process per connection string and pool settings - shared by every DatabaseManager
+_pools = {}
+_pools_lock = threading.Lock()
+
+# pools a forked child inherited from its parent - kept referenced and never closed here, so
+# garbage collecting them can't send Terminate on sockets the parent is still using
+_inherited_pools = []
+
+
+class PooledConnections:
+    """thread safe connection pool with health checks and borrow/return timing"""
+    def __init__(self, connection_params, min_size=1, max_size=10, borrow_timeout=30.0, health_check_interval=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.borrow_timeout = borrow_timeout
+        self.health_check_interval = health_check_interval # seconds a connection can idle before being pinged
+        self.pid = os.getpid() # pools can't be shared across forked processes
+
+        self._pool = pg_pool.ThreadedConnectionPool(min_size, max_size, **connection_params)
+        # psycopg2 raises right away when the pool is empty, so block on a semaphore instead
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {} # id(conn) -> time connection was returned
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'borrows': 0,
+            'borrow_wait_total': 0.0,
+            'borrow_wait_max': 0.0,
+            'hold_total': 0.0,
+            'hold_max': 0.0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+        }
+
+    def _is_healthy(self, conn):
+        """check connection is still usable - only pings connections that have been idle"""
+        if conn.closed:
+            return False
+
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback() # don't leave the ping transaction open
+            return True
+        except psycopg2.Error:
+            return False
+
+    def borrow(self):
+        """get a healthy connection from the pool, waiting up to borrow_timeout seconds"""
+        start = time.perf_counter()
+
+        if not self._slots.acquire(timeout=self.borrow_timeout):
+            with self._stats_lock:
+                self._stats['timeouts'] += 1
+            raise pg_pool.PoolError(f"Timed out after {self.borrow_timeout}s waiting for a database connection")
+
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                # drop broken connection and open a replacement
+                with self._stats_lock:
+                    self._stats['health_check_failures'] += 1
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats['borrows'] += 1
+            self._stats['borrow_wait_total'] += wait
+            self._stats['borrow_wait_max'] = max(self._stats['borrow_wait_max'], wait)
+
+        return conn, time.perf_counter()
+
+    def give_back(self, conn, borrowed_at, close=False):
+        """return connection to the pool and record how long it was held"""
+        held = time.perf_counter() - borrowed_at
+
+        try:
+            if conn.closed:
+                close = True
+            if close:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+        with self._stats_lock:
+            self._stats['hold_total'] += held
+            self._stats['hold_max'] = max(self._stats['hold_max'], held)
+
+    def stats(self):
+        """snapshot of pool timing stats"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        borrows = stats['borrows'] or 1
+        stats['borrow_wait_avg'] = stats['borrow_wait_total'] / borrows
+        stats['hold_avg'] = stats['hold_total'] / borrows
+        stats['min_size'] = self.min_size
+        stats['max_size'] = self.max_size
+        return stats
+
+    def close(self):
+        """close all connections in the pool"""
+        self._pool.closeall()
+
+
+def get_pool(connection_params, **pool_options):
+    """get the shared pool for these connection and pool settings, creating it on first use
+    managers asking for a different pool size get their own pool rather than the first caller's"""
+    key = (tuple(sorted(connection_params.items())), tuple(sorted(pool_options.items())))
+    pid = os.getpid()
+
+    with _pools_lock:
+        existing = _pools.get(key)
+        if existing is not None and existing.pid == pid:
+            return existing
+
+        # first use, or we are in a forked child - never reuse the parent's sockets
+        if existing is not None:
+            _inherited_pools.append(existing)
+        shared = PooledConnections(connection_params, **pool_options)
+        _pools[key] = shared
+        return shared
+
+
+def close_pools():
+    """close every pool created in this process - pools inherited from a parent are left open"""
+    with _pools_lock:
+        for shared in _pools.values():
+            if shared.pid == os.getpid():
+                shared.close()
+            else:
+                _inherited_pools.append(shared)
+        _pools.clear()
+
 
 class DatabaseManager:
-    def __init__(self): # initialize connection to db
+    def __init__(self, pooled=True, min_size=1, max_size=10, borrow_timeout=30.0, health_check_interval=30.0): # initialize connection to db
         self.connection_params = {
             'host': 'localhost',
             'port': '5432',
@@ -20,16 +181,71 @@ class DatabaseManager:
             'password': 'golf_password'
         }
         self.connection_string = self._get_connection_string()
-        self.engine = create_engine(self.connection_string)
+        self._engine = None
+
+        # pool settings - the pool itself is created lazily on first query
+        self.pooled = pooled
+        self.pool_options = {
+            'min_size': min_size,
+            'max_size': max_size,
+            'borrow_timeout': borrow_timeout,
+            'health_check_interval': health_check_interval,
+        }
 
     def _get_connection_string(self):
         """get connection string"""
         return f"postgresql://{self.connection_params['user']}:{self.connection_params['password']}@{self.connection_params['host']}:{self.connection_params['port']}/{self.connection_params['database']}"
 
+    @property
+    def engine(self):
+        """sqlalchemy engine for pandas.read_sql - sqlalchemy is only imported when it is first used"""
+        if self._engine is None:
+            from sqlalchemy import create_engine
+            self._engine = create_engine(self.connection_string)
+        return self._engine
+
+    @property
+    def pool(self):
+        """shared connection pool for this process"""
+        return get_pool(self.connection_params, **self.pool_options)
+
+    @contextmanager
+    def connection(self):
+        """borrow a connection - pooled or a fresh one if pooling is off"""
+        if not self.pooled:
+            conn = psycopg2.connect(**self.connection_params)
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        shared = self.pool
+        conn, borrowed_at = shared.borrow()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            broken = True # server went away, don't hand this connection out again
+            raise
+        finally:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback() # never return a connection mid transaction
+                except psycopg2.Error:
+                    broken = True
+            shared.give_back(conn, borrowed_at, close=broken)
+
+    def pool_stats(self):
+        """borrow/return timing for the shared pool"""
+        if not self.pooled:
+            return None
+        return self.pool.stats()
+
     def test_connection(self):
         """test database connection"""
         try:
-            with psycopg2.connect(**self.connection_params) as conn:
+            with self.connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute("SELECT current_database(), version()")
                     result = cur.fetchone()
@@ -41,27 +257,164 @@ class DatabaseManager:
 
     def execute_query(self, query, params=None):
         """Execute query and return results"""
+        statement = fingerprint(query)
+        started = time.perf_counter()
         try:
-            with psycopg2.connect(**self.connection_params) as conn:
-                # to return query results as dictionary
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute(query, params)
-                    # check if it's a SELECT query
-                    if query.strip().upper().startswith('SELECT'):
-                        return cur.fetchall()  # fetch and return the results
-                    else:
-                        # For INSERT/UPDATE/DELETE, commit and return affected rows
-                        conn.commit()
-                        return cur.rowcount
+            with self.connection() as conn:
+                try:
+                    # to return query results as dictionary
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute(query, params)
+                        # check if it's a SELECT query
+                        if query.strip().upper().startswith('SELECT'):
+                            return cur.fetchall()  # fetch and return the results
+                        elif cur.description is not None:
+                            # INSERT/UPDATE ... RETURNING - commit and return the returned rows
+                            rows = cur.fetchall()
+                            conn.commit()
+                            return rows
+                        else:
+                            # For INSERT/UPDATE/DELETE, commit and return affected rows
+                            conn.commit()
+                            return cur.rowcount
+                except Exception:
+                    # rollback on any error
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
         except Exception as e:
-            # rollback on any error
-            if conn:
-                conn.rollback()
+            QUERY_ERRORS.inc(statement)
             print(f"Database query error: {e}")
             return None
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - started, statement)
+
+    def get_player_context(self, player_name, include_history=False):
+        """player id, handicap, round count and latest round id in one statement
+        include_history adds the player's rounds with weather, oldest first
+        returns None if the player doesn't exist"""
+        history_column = ""
+        if include_history:
+            history_column = """,
+                COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'score', r.score,
+                        'round_date', r.round_date,
+                        'avg_temp', w.avg_temp,
+                        'wind_speed', w.wind_speed,
+                        'precipitation', w.precipitation
+                    ) ORDER BY r.round_date)
+                    FROM rounds r
+                    LEFT JOIN weather w ON r.round_date = w.date
+                    WHERE r.player_id = p.player_id
+                ), '[]'::json) AS history"""
+
+        context_query = f"""
+            SELECT
+                p.player_id,
+                p.handicap,
+                rs.round_count,
+                rs.latest_round_id{history_column}
+            FROM players p
+            CROSS JOIN LATERAL (
+                SELECT COUNT(*) AS round_count, MAX(round_id) AS latest_round_id
+                FROM rounds
+                WHERE player_id = p.player_id
+            ) rs
+            WHERE p.player_name = %s
+        """
+        result = self.execute_query(context_query, (player_name,))
+
+        return result[0] if result else None
+
+    # reports from database/queries.sql, read from the summary tables kept up to date by init.sql triggers.
+    # each reads one row per player / category / month, so latency doesn't grow with rounds
+
+    def player_performance_summary(self):
+        """rounds, average, best and worst score for every player"""
+        return self.execute_query("""
+            SELECT
+                p.player_name,
+                p.member_status,
+                p.handicap,
+                COALESCE(s.rounds_played, 0) AS total_rounds,
+                s.score_sum::FLOAT / s.rounds_played AS avg_score,
+                s.best_score,
+                s.worst_score
+            FROM players p
+            LEFT JOIN player_round_summary s ON p.player_id = s.player_id
+            ORDER BY avg_score
+        """)
+
+    def weather_impact_summary(self):
+        """rounds and scores per weather category"""
+        return self.execute_query("""
+            SELECT
+                weather_category,
+                rounds_played,
+                score_sum::FLOAT / rounds_played AS avg_score,
+                best_score,
+                worst_score
+            FROM weather_impact_summary
+            ORDER BY avg_score
+        """)
+
+    def monthly_trends(self):
+        """rounds played and average score per month"""
+        return self.execute_query("""
+            SELECT
+                year,
+                month,
+                rounds_played,
+                score_sum::FLOAT / rounds_played AS avg_score
+            FROM monthly_round_summary
+            ORDER BY year, month
+        """)
+
+    def top_performers_by_conditions(self, min_rounds=3):
+        """average score per player in rainy, windy and good conditions - players with min_rounds or more"""
+        return self.execute_query("""
+            SELECT
+                p.player_name,
+                s.conditions,
+                s.rounds_played,
+                s.score_sum::FLOAT / s.rounds_played AS avg_score
+            FROM player_conditions_summary s
+            JOIN players p ON p.player_id = s.player_id
+            WHERE s.rounds_played >= %s
+            ORDER BY s.conditions, avg_score
+        """, (min_rounds,))
+
+    def refresh_analytics(self):
+        """rebuild the summary tables from rounds - needed after rounds are updated or deleted"""
+        return self._run_maintenance("refresh_analytics_summaries")
+
+    def rebuild_handicap_state(self):
+        """rebuild the rolling handicap windows, rounds_played and handicaps from rounds"""
+        return self._run_maintenance("rebuild_handicap_state")
+
+    def verify_handicap_state(self):
+        """players whose rolling handicap state disagrees with the full history formula - empty list if all match"""
+        return self.execute_query("SELECT * FROM verify_handicap_state()")
+
+    def _run_maintenance(self, function_name):
+        """call a database maintenance function in its own transaction - execute_query doesn't commit SELECTs"""
+        statement = f"SELECT {function_name}()"
+        try:
+            with QUERY_SECONDS.time(statement):
+                with self.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(statement)
+                    conn.commit()
+            return True
+        except Exception as e:
+            QUERY_ERRORS.inc(statement)
+            print(f"{function_name} error: {e}")
+            return False
 
 if __name__ == "__main__":
     # test
     db = DatabaseManager()
     db.test_connection()
-    print(db.execute_query("select * from players limit 3"))
\ No newline at end of file
+    print(db.execute_query("select * from players limit 3"))
+    print(db.pool_stats())
@@ -0,0 +1,312 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+ETL Engine
+    Shared base for the Spark (data_processing.DataProcessor) and pandas
+    (local_engine.LocalProcessor) pipelines, and the choice between them
+
+Both engines read the same raw files and ingestion manifest, derive the same
+round dates from date_seed and load the same rows, so either one can run a given
+drop. Nothing here imports pyspark - a local run never starts a JVM.
+create_processor("auto") picks the local engine when the raw bytes still to be
+loaded are under LOCAL_ENGINE_MAX_BYTES
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from src.metrics import registry
+
+STAGE_SECONDS = registry.histogram("etl_stage_duration_seconds", "Wall time of each ETL step", ("stage",))
+STAGE_ROWS = registry.counter("etl_stage_rows_total", "Rows produced or written by each ETL step", ("stage",))
+WRITE_SECONDS = registry.histogram("etl_write_duration_seconds", "Time to write a table", ("table", "backend"))
+WRITE_ROWS = registry.counter("etl_rows_written_total", "Rows written per table", ("table", "backend"))
+
+ENGINES = ('auto', 'spark', 'local')
+
+# pending raw input above this goes to spark - below it the JVM startup costs more than it saves
+LOCAL_ENGINE_MAX_BYTES = 64 * 1024 * 1024
+
+# raw csv columns - golf files only need their leading columns, anything after Open.R4 is dropped
+GOLF_RAW_COLUMNS = ['Year', 'Name', 'Course', 'Yards', 'Par', 'Open.Position', 'Integer.Position',
+                    'Position.Grouping', 'Open.R1', 'Open.R2', 'Open.R3', 'Open.R4']
+WEATHER_RAW_COLUMNS = ['time', 'tavg', 'tmin', 'tmax', 'prcp', 'wdir', 'wspd', 'pres']
+ROUND_COLUMNS = ['Open.R1', 'Open.R2', 'Open.R3', 'Open.R4']
+
+# data/ relative to this file, not the working directory - runs from the project root or src/ read the same files
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+
+# first date kept from the weather file
+WEATHER_START_DATE = '2017-04-01'
+
+# natural key of a round (idx_rounds_natural_key) - the raw row it came from and which of its rounds it is.
+# the row hash covers the scores, so rounds of a changed file are reconciled by remove_replaced_rounds()
+ROUND_NATURAL_KEY = ['player_id', 'round_date', 'round_index', 'source_file', 'source_key']
+
+
+class EtlProcessor:
+    engine = None
+
+    # conflict handling when merging a staging table into its target
+    # rounds already loaded are skipped, so a rerun only inserts (and triggers on) the difference
+    merge_conflict_clauses = {
+        'players': 'ON CONFLICT (player_name) DO NOTHING',
+        'weather': 'ON CONFLICT (date) DO NOTHING',
+        'rounds': f"ON CONFLICT ({', '.join(ROUND_NATURAL_KEY)}) DO NOTHING",
+    }
+
+    # record of raw files already loaded - lets scheduled runs only process new drops
+    raw_directory = os.path.join(DATA_DIR, "raw", "")
+    manifest_path = os.path.join(DATA_DIR, "processed", "ingest_manifest.json")
+
+    # columnar copies of the raw csvs - golf partitioned by source file, weather by year
+    staged_directory = os.path.join(DATA_DIR, "staged", "")
+
+    def __init__(self, date_seed=5110):
+        # seed for the generated round dates - same seed and data give the same dates
+        self.date_seed = date_seed
+
+        # wall time, rows and shuffle bytes for each timed step
+        self.stage_stats = []
+        self.load_stats = [] # rows per second for each table written this run
+
+    def _shuffle_bytes(self):
+        """total shuffle read/write bytes so far - None for engines that don't shuffle"""
+        return None
+
+    @contextmanager
+    def stage(self, name):
+        """time a pipeline step - callers can set record['rows'] inside the block,
+        otherwise rows are the rows written to the database during it"""
+        record = {'stage': name, 'rows': None}
+        written_before = len(self.load_stats)
+        shuffle_before = self._shuffle_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if record['rows'] is None and len(self.load_stats) > written_before:
+                record['rows'] = sum(stats['rows'] for stats in self.load_stats[written_before:])
+            STAGE_SECONDS.observe(record['seconds'], name)
+            if record['rows'] is not None:
+                STAGE_ROWS.inc(name, amount=record['rows'])
+            shuffle_after = self._shuffle_bytes()
+            if shuffle_before is not None and shuffle_after is not None:
+                record['shuffle_read_bytes'] = shuffle_after[0] - shuffle_before[0]
+                record['shuffle_write_bytes'] = shuffle_after[1] - shuffle_before[1]
+            if record['rows'] is not None and record['seconds'] > 0:
+                record['rows_per_second'] = record['rows'] / record['seconds']
+            self.stage_stats.append(record)
+
+    def _record_write(self, table, backend, row_count, elapsed, inserted=None):
+        """add a finished table write to load_stats and the metrics
+        inserted is how many rows the merge actually added, when it's known"""
+        rows_per_second = row_count / elapsed if elapsed > 0 else 0.0
+        WRITE_SECONDS.observe(elapsed, table, backend)
+        WRITE_ROWS.inc(table, backend, amount=row_count)
+        self.load_stats.append({
+            'table': table,
+            'backend': backend,
+            'rows': row_count,
+            'inserted': inserted,
+            'seconds': elapsed,
+            'rows_per_second': rows_per_second,
+        })
+        new_rows = f", {inserted} new" if inserted is not None else ""
+        print(f"Wrote {row_count} rows to {table} via {backend}{new_rows} in {elapsed:.2f}s ({rows_per_second:.0f} rows/s)")
+
+    def raw_files(self):
+        """golf and weather csvs in the raw directory"""
+        golf_files = glob.glob(f"{self.raw_directory}golf*.csv")
+        weather_files = glob.glob(f"{self.raw_directory}boston_weather_data.csv")
+        return golf_files, weather_files
+
+    @staticmethod
+    def _file_checksum(path):
+        """sha256 of a file, read in chunks"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def load_manifest(self):
+        """load ingestion manifest - empty if nothing has been ingested yet"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        """write manifest atomically so a crash can't leave it half written"""
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
+
+    def _new_or_changed_files(self, paths, manifest):
+        """files not in the manifest, or whose size/checksum changed since they were loaded"""
+        pending = {}
+        for path in sorted(paths):
+            key = os.path.relpath(path, self.raw_directory)
+            stat = os.stat(path)
+            entry = manifest.get(key)
+
+            # unchanged size and mtime - trust the manifest without hashing the file again
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+
+            checksum = self._file_checksum(path)
+            if entry and entry["size"] == stat.st_size and entry["checksum"] == checksum:
+                # only touched, contents the same - refresh mtime so we don't hash it next run
+                pending[key] = dict(entry, mtime=stat.st_mtime)
+                continue
+
+            pending[key] = {
+                "path": path,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "checksum": checksum,
+                "changed": entry is not None,
+                "new_data": True,
+            }
+
+        return pending
+
+    def _pending_raw_files(self, force=False):
+        """new or changed golf and weather files, recorded for mark_files_ingested
+        returns (golf paths, weather paths) - None for both if the raw directory is empty"""
+        golf_files, weather_files = self.raw_files()
+
+        # let user know how many files we found
+        print(f"Found {len(golf_files)} golf files")
+        print(f"Found {len(weather_files)} weather files")
+
+        if not golf_files and not weather_files:
+            print("No files found")
+            return None, None
+
+        # compare against files already loaded
+        manifest = {} if force else self.load_manifest()
+        pending_golf = self._new_or_changed_files(golf_files, manifest)
+        pending_weather = self._new_or_changed_files(weather_files, manifest)
+        self._pending_files = {**pending_golf, **pending_weather}
+
+        new_golf_files = [entry["path"] for entry in pending_golf.values() if entry.get("new_data")]
+        new_weather_files = [entry["path"] for entry in pending_weather.values() if entry.get("new_data")]
+
+        for path in new_golf_files + new_weather_files:
+            status = "changed" if self._pending_files[os.path.relpath(path, self.raw_directory)]["changed"] else "new"
+            print(f"Using {status} file: {path}") # let user know file being read
+
+        return new_golf_files, new_weather_files
+
+    def mark_files_ingested(self):
+        """record files from the last extract as processed - call once the load succeeded"""
+        pending = getattr(self, "_pending_files", {})
+        if not pending:
+            return
+
+        manifest = self.load_manifest()
+        ingested_at = datetime.now().isoformat(timespec="seconds")
+        for key, entry in pending.items():
+            record = {k: v for k, v in entry.items() if k not in ("changed", "new_data")}
+            if entry.get("new_data"):
+                record["ingested_at"] = ingested_at
+            manifest[key] = record
+
+        self._save_manifest(manifest)
+        self._pending_files = {}
+        print(f"Recorded {len(pending)} files in ingestion manifest")
+
+    def changed_source_files(self):
+        """names of files from the last extract that were loaded before and have changed since"""
+        pending = getattr(self, "_pending_files", {})
+        return sorted(os.path.basename(entry["path"]) for entry in pending.values()
+                      if entry.get("changed") and entry.get("new_data"))
+
+    def _merge_staged(self, cur, table, staging_table, column_list):
+        """merge a loaded staging table into its target - returns the number of rows inserted
+        for rounds, rounds of changed files that the reload no longer has are removed first, in
+        the same transaction, so a corrected score replaces the old round instead of joining it"""
+        if table == 'rounds':
+            changed = self.changed_source_files()
+            if changed:
+                cur.execute("SELECT remove_replaced_rounds(%s::regclass, %s)", (staging_table, changed))
+                removed = cur.fetchone()[0]
+                if removed:
+                    print(f"Removed {removed} rounds no longer in {', '.join(changed)}")
+
+        # single statement merge - statement level triggers on the target fire once,
+        # and only for the rows it inserted
+        cur.execute(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM {staging_table}
+            {self.merge_conflict_clauses[table]}
+        """)
+        return cur.rowcount
+
+    def clear_dimension_cache(self):
+        """drop cached reference tables - call at the end of a run"""
+        self._dimensions = {}
+
+
+def pending_input_bytes(raw_directory=None, manifest_path=None, force=False):
+    """size of the raw files a run would load - size and mtime only, nothing is hashed"""
+    probe = EtlProcessor()
+    if raw_directory is not None:
+        probe.raw_directory = raw_directory
+    if manifest_path is not None:
+        probe.manifest_path = manifest_path
+
+    manifest = {} if force else probe.load_manifest()
+    total = 0
+    golf_files, weather_files = probe.raw_files()
+    for path in golf_files + weather_files:
+        stat = os.stat(path)
+        entry = manifest.get(os.path.relpath(path, probe.raw_directory))
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            continue
+        total += stat.st_size
+    return total
+
+
+def choose_engine(engine='auto', raw_directory=None, manifest_path=None, force=False,
+                  max_local_bytes=LOCAL_ENGINE_MAX_BYTES):
+    """'spark' or 'local' - auto compares the pending raw bytes with max_local_bytes"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown ETL engine: {engine}")
+    if engine != 'auto':
+        return engine
+
+    pending = pending_input_bytes(raw_directory, manifest_path, force)
+    chosen = 'local' if pending <= max_local_bytes else 'spark'
+    print(f"{pending / 1e6:.1f} MB of raw input to load - using the {chosen} engine")
+    return chosen
+
+
+def create_processor(engine='auto', write_backends=None, date_seed=5110, raw_directory=None,
+                     staged_directory=None, manifest_path=None, force=False):
+    """processor for the chosen engine - pyspark is only imported when spark is picked"""
+    engine = choose_engine(engine, raw_directory, manifest_path, force)
+    if engine == 'local':
+        from src.local_engine import LocalProcessor
+        process = LocalProcessor(write_backends=write_backends, date_seed=date_seed)
+    else:
+        from src.data_processing import DataProcessor
+        process = DataProcessor(write_backends=write_backends, date_seed=date_seed)
+
+    if raw_directory is not None:
+        process.raw_directory = raw_directory
+    if staged_directory is not None:
+        process.staged_directory = staged_directory
+    if manifest_path is not None:
+        process.manifest_path = manifest_path
+    return process
@@ -0,0 +1,134 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Gradient Boosting Inference
+    NumPy engine for the fitted GradientBoostingRegressor in model_GB.joblib
+
+Every tree is flattened into shared contiguous arrays (feature, threshold, left,
+right, value) and all trees are walked at once, one level per step. This skips
+sklearn's per call validation and per tree loop, which dominates single row
+predictions. sklearn's compiled loop is still faster for large batches, so
+RoundBooking uses this engine for small batches only in "auto" mode.
+Results match model.predict to floating point tolerance
+
+Run this file to compare latency against sklearn
+"""
+import numpy as np
+
+TREE_LEAF = -1 # sklearn marks leaves with child index -1
+
+
+class FlatGradientBoosting:
+    def __init__(self, feature, threshold, left, right, value, roots, depth, init_value, learning_rate, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        # children[2 * node + went_left] - one gather per step instead of two plus a where
+        self.children = np.ascontiguousarray(np.stack([right, left], axis=1).ravel())
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.init_value = init_value
+        self.learning_rate = learning_rate
+        self.n_features = n_features
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """flatten a fitted GradientBoostingRegressor (squared error loss)"""
+        if getattr(model, 'loss', 'squared_error') != 'squared_error':
+            raise ValueError(f"Only squared_error loss is supported, got {model.loss}")
+
+        trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        feature, threshold, left, right, value = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            is_leaf = tree.children_left == TREE_LEAF
+            # leaves point at themselves so extra traversal steps are no-ops
+            own_index = np.arange(tree.node_count) + offset
+            left.append(np.where(is_leaf, own_index, tree.children_left + offset))
+            right.append(np.where(is_leaf, own_index, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            value.append(tree.value[:, 0, 0])
+
+        # constant starting prediction from the init estimator
+        init_value = float(model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0])
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(feature), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(threshold), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(left), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(right), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(value), dtype=np.float64),
+            roots=np.ascontiguousarray(offsets, dtype=np.intp),
+            depth=max(tree.max_depth for tree in trees),
+            init_value=init_value,
+            learning_rate=float(model.learning_rate),
+            n_features=model.n_features_in_,
+        )
+
+    def predict(self, X):
+        """predict for a 2d array of model features (one row or many)"""
+        # sklearn compares features as float32, so do the same to land on the same side of each split
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+
+        # trees x rows matrix of current node, every tree starts at its root
+        n_rows = X.shape[0]
+        X_by_feature = np.ascontiguousarray(X.T).ravel() # feature major so lookups are feature * n_rows + row
+        columns = np.arange(n_rows)
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+
+        for _ in range(self.depth):
+            values = X_by_feature.take(self.feature.take(nodes) * n_rows + columns)
+            went_left = values <= self.threshold.take(nodes)
+            nodes = self.children.take(nodes * 2 + went_left)
+
+        return self.init_value + self.learning_rate * self.value.take(nodes).sum(axis=0)
+
+if __name__ == "__main__":
+    # latency comparison against sklearn on the production model
+    import os
+    import time
+    import joblib
+    import pandas as pd
+
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "models")
+    score_model = joblib.load(os.path.join(models_dir, "model_GB.joblib"))
+    model = score_model['model']
+    engine = FlatGradientBoosting.from_sklearn(model)
+
+    rng = np.random.default_rng(5110)
+    n_features = model.n_features_in_
+
+    def timed(function, X, repeats):
+        """median seconds per call"""
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function(X)
+            times.append(time.perf_counter() - start)
+        return float(np.median(times))
+
+    print(f"{'rows':>7} {'sklearn ms':>11} {'numpy ms':>9} {'speedup':>8} {'max abs diff':>13}")
+    for n_rows in [1, 10, 100, 1000, 10000]:
+        X = rng.normal(size=(n_rows, n_features))
+        X[:, -1] = rng.integers(0, 2, n_rows) # weekend flag
+        repeats = 200 if n_rows <= 100 else 20
+
+        # sklearn gets a DataFrame, same as RoundBooking passes it
+        X_frame = pd.DataFrame(X, columns=score_model['feature_names'])
+
+        sklearn_time = timed(model.predict, X_frame, repeats)
+        numpy_time = timed(engine.predict, X, repeats)
+        diff = np.max(np.abs(model.predict(X_frame) - engine.predict(X)))
+
+        print(f"{n_rows:>7} {sklearn_time * 1000:>11.3f} {numpy_time * 1000:>9.3f} "
+              f"{sklearn_time / numpy_time:>7.1f}x {diff:>13.2e}")
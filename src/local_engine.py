@@ -0,0 +1,450 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Local Engine
+    pandas version of the ETL pipeline for small runs - no JVM
+
+Same steps as data_processing.DataProcessor (extract, clean_golf_data,
+clean_weather_data, process_players and the weather and rounds imports) and the
+same rules: Spark's CSV null handling, weather from WEATHER_START_DATE, scores of
+0 dropped, rounds only for known players and weather dates. Round dates use
+Spark's xxhash64 reimplemented below, so both engines give a raw row the same
+dates. Every table is loaded with COPY into a temp table merged in one INSERT,
+like the Spark "copy" backend. CSVs are parsed with pyarrow when it's installed.
+Raw files aren't staged to parquet - that copy is only kept by Spark runs
+"""
+import io
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.database import DatabaseManager
+from src.etl_engine import (EtlProcessor, GOLF_RAW_COLUMNS, WEATHER_RAW_COLUMNS, ROUND_COLUMNS,
+                            WEATHER_START_DATE)
+
+try:
+    import pyarrow # noqa: F401 - only checked for, pandas uses it to parse csvs
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+# xxhash64 constants
+PRIME64_1 = 0x9E3779B185EBCA87
+PRIME64_2 = 0xC2B2AE3D27D4EB4F
+PRIME64_3 = 0x165667B19E3779F9
+PRIME64_4 = 0x85EBCA77C2B2AE63
+PRIME64_5 = 0x27D4EB2F165667C5
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# seed spark's xxhash64() starts from
+SPARK_HASH_SEED = 42
+
+GOLF_INTEGER_COLUMNS = ['Year', 'Yards', 'Par', 'Integer.Position', 'Position.Grouping'] + ROUND_COLUMNS
+WEATHER_FLOAT_COLUMNS = WEATHER_RAW_COLUMNS[1:]
+
+
+def _rotl(value, bits):
+    return ((value << bits) | (value >> (64 - bits))) & MASK64
+
+
+def _round(accumulator, lane):
+    accumulator = (accumulator + lane * PRIME64_2) & MASK64
+    return (_rotl(accumulator, 31) * PRIME64_1) & MASK64
+
+
+def _merge_round(accumulator, value):
+    accumulator ^= _round(0, value)
+    return (accumulator * PRIME64_1 + PRIME64_4) & MASK64
+
+
+def xxh64(data, seed):
+    """64 bit xxhash of bytes - unsigned"""
+    length = len(data)
+    offset = 0
+    if length >= 32:
+        v1 = (seed + PRIME64_1 + PRIME64_2) & MASK64
+        v2 = (seed + PRIME64_2) & MASK64
+        v3 = seed & MASK64
+        v4 = (seed - PRIME64_1) & MASK64
+        while offset + 32 <= length:
+            l1, l2, l3, l4 = struct.unpack_from("<4Q", data, offset)
+            v1, v2, v3, v4 = _round(v1, l1), _round(v2, l2), _round(v3, l3), _round(v4, l4)
+            offset += 32
+        h = (_rotl(v1, 1) + _rotl(v2, 7) + _rotl(v3, 12) + _rotl(v4, 18)) & MASK64
+        for v in (v1, v2, v3, v4):
+            h = _merge_round(h, v)
+    else:
+        h = (seed + PRIME64_5) & MASK64
+
+    h = (h + length) & MASK64
+    while offset + 8 <= length:
+        h ^= _round(0, struct.unpack_from("<Q", data, offset)[0])
+        h = (_rotl(h, 27) * PRIME64_1 + PRIME64_4) & MASK64
+        offset += 8
+    if offset + 4 <= length:
+        h ^= (struct.unpack_from("<I", data, offset)[0] * PRIME64_1) & MASK64
+        h = (_rotl(h, 23) * PRIME64_2 + PRIME64_3) & MASK64
+        offset += 4
+    while offset < length:
+        h ^= (data[offset] * PRIME64_5) & MASK64
+        h = (_rotl(h, 11) * PRIME64_1) & MASK64
+        offset += 1
+
+    h ^= h >> 33
+    h = (h * PRIME64_2) & MASK64
+    h ^= h >> 29
+    h = (h * PRIME64_3) & MASK64
+    h ^= h >> 32
+    return h
+
+
+def _rotl_array(values, bits):
+    return (values << np.uint64(bits)) | (values >> np.uint64(64 - bits))
+
+
+def xxh64_short(data, seeds):
+    """xxh64 of one short (< 32 bytes) value under an array of uint64 seeds - vectorized,
+    for hash chains where the next column's seed is the previous column's hash"""
+    length = len(data)
+    if length >= 32:
+        raise ValueError("xxh64_short only handles values under 32 bytes")
+
+    with np.errstate(over="ignore"):
+        h = seeds.astype(np.uint64) + np.uint64((PRIME64_5 + length) & MASK64)
+        offset = 0
+        while offset + 8 <= length:
+            h ^= np.uint64(_round(0, struct.unpack_from("<Q", data, offset)[0]))
+            h = _rotl_array(h, 27) * np.uint64(PRIME64_1) + np.uint64(PRIME64_4)
+            offset += 8
+        if offset + 4 <= length:
+            h ^= np.uint64((struct.unpack_from("<I", data, offset)[0] * PRIME64_1) & MASK64)
+            h = _rotl_array(h, 23) * np.uint64(PRIME64_2) + np.uint64(PRIME64_3)
+            offset += 4
+        while offset < length:
+            h ^= np.uint64((data[offset] * PRIME64_5) & MASK64)
+            h = _rotl_array(h, 11) * np.uint64(PRIME64_1)
+            offset += 1
+
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(PRIME64_2)
+        h ^= h >> np.uint64(29)
+        h *= np.uint64(PRIME64_3)
+        h ^= h >> np.uint64(32)
+    return h
+
+
+def spark_pmod_pick(row_hashes, round_name, value, choices):
+    """pmod(xxhash64(row_key, Round, lit(value)), choices) as spark computes it, given
+    row_hashes = xxhash64 of each row_key. spark hashes a string as its utf-8 bytes and an
+    int literal as its 4 little endian bytes, each seeded with the hash so far"""
+    hashes = xxh64_short(round_name.encode("utf-8"), row_hashes)
+    hashes = xxh64_short(struct.pack("<i", value), hashes)
+    return hashes.view(np.int64) % choices # numpy % has the divisor's sign, like pmod
+
+
+def read_csv_columns(paths, columns):
+    """read the leading len(columns) columns of csvs positionally, header skipped, like spark
+    with a declared schema - only empty fields are null, all values read as strings"""
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path, header=None, skiprows=1, usecols=range(len(columns)), dtype=str,
+                         keep_default_na=False, na_values=[""], engine=CSV_ENGINE)
+        df.columns = columns
+        df["source_file"] = os.path.basename(path)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+class LocalProcessor(EtlProcessor):
+    engine = 'local'
+
+    # columns needed from each reference table
+    dimension_columns = {
+        'players': ['player_id', 'player_name'],
+        'weather': ['date'],
+    }
+
+    def __init__(self, write_backends=None, date_seed=5110):
+        super().__init__(date_seed=date_seed)
+
+        # every table goes through COPY - the spark jdbc backend has no pandas equivalent,
+        # so asking for it is an error rather than silently writing with COPY
+        for table, backend in (write_backends or {}).items():
+            if backend == 'jdbc':
+                raise ValueError(f"The local engine has no jdbc backend ({table}) - use --engine spark for jdbc writes")
+            if backend != 'copy':
+                raise ValueError(f"Unknown write backend for {table}: {backend}")
+        self.write_backends = {'players': 'copy', 'weather': 'copy', 'rounds': 'copy'}
+
+        # run scoped cache of reference tables - each is read from the db once per run
+        self._dimensions = {}
+
+        self.db = DatabaseManager()
+
+        # test connection
+        if not self.db.test_connection():
+            raise Exception("Failed to connect to database")
+
+        print("Database connection established")
+
+    def count_table(self, table):
+        """row count computed by postgres"""
+        result = self.db.execute_query(f"SELECT COUNT(*) AS row_count FROM {table}")
+        return int(result[0]['row_count'])
+
+    def _read_query(self, query, columns):
+        """query results as a dataframe"""
+        rows = self.db.execute_query(query)
+        if rows is None:
+            raise RuntimeError(f"Query failed: {query}")
+        return pd.DataFrame(rows, columns=columns)
+
+    def get_dimension(self, table):
+        """cached reference table (players or weather) with only the needed columns"""
+        if table not in self._dimensions:
+            columns = self.dimension_columns[table]
+            dimension = self._read_query(f"SELECT {', '.join(columns)} FROM {table}", columns)
+            if table == 'weather':
+                dimension['date'] = pd.to_datetime(dimension['date'])
+            self._dimensions[table] = dimension
+
+        return self._dimensions[table]
+
+    def _extend_dimension(self, table, new_rows):
+        """add newly inserted rows to a cached reference table instead of re-reading it"""
+        updated = pd.concat([self.get_dimension(table), new_rows[self.dimension_columns[table]]],
+                            ignore_index=True)
+        self._dimensions[table] = updated
+        return updated
+
+    def extract_raw_data(self, force=False):
+        """read new or changed raw csvs listed by the ingestion manifest into dataframes
+        returns None for a dataset with nothing new to load. force=True reloads every file"""
+        new_golf_files, new_weather_files = self._pending_raw_files(force)
+        if new_golf_files is None:
+            return None, None
+
+        df_golf_raw = None
+        if new_golf_files:
+            df_golf_raw = read_csv_columns(new_golf_files, GOLF_RAW_COLUMNS)
+            for column in GOLF_INTEGER_COLUMNS:
+                # values that don't parse become null, as in spark's permissive csv mode
+                df_golf_raw[column] = pd.to_numeric(df_golf_raw[column], errors="coerce").astype("Int64")
+        else:
+            print("No new golf files to process")
+
+        df_weather_raw = None
+        if new_weather_files:
+            df_weather_raw = read_csv_columns(new_weather_files, WEATHER_RAW_COLUMNS)
+            df_weather_raw["time"] = pd.to_datetime(df_weather_raw["time"], format="%Y-%m-%d", errors="coerce")
+            for column in WEATHER_FLOAT_COLUMNS:
+                df_weather_raw[column] = pd.to_numeric(df_weather_raw[column], errors="coerce")
+        else:
+            print("No new weather files to process")
+
+        return df_golf_raw, df_weather_raw
+
+    def clean_golf_data(self, df_golf_raw):
+        """clean golf data - one row per round with its seeded date, same as the spark version"""
+        df = df_golf_raw[df_golf_raw['Name'].notna()].reset_index(drop=True)
+
+        # identity of each raw row, built like spark's concat_ws - nulls skipped
+        key_columns = [c for c in ['Name', 'source_file', 'Year', 'Course'] if c in df.columns] + ROUND_COLUMNS
+        parts = [df[c].astype("string").tolist() for c in key_columns]
+        row_hashes = np.fromiter(
+            (xxh64("|".join(v for v in values if isinstance(v, str)).encode("utf-8"), SPARK_HASH_SEED)
+             for values in zip(*parts)),
+            dtype=np.uint64, count=len(df)
+        )
+
+        # unpivot the round columns - row by row, R1 to R4, the order spark's unpivot gives
+        rounds = []
+        for round_number, round_name in enumerate(ROUND_COLUMNS, start=1):
+            dates = pd.to_datetime(pd.DataFrame({
+                'year': spark_pmod_pick(row_hashes, round_name, self.date_seed, 6) + 2017,
+                'month': spark_pmod_pick(row_hashes, round_name, self.date_seed + 1, 7) + 4,
+                'day': spark_pmod_pick(row_hashes, round_name, self.date_seed + 2, 28) + 1,
+            }))
+            rounds.append(pd.DataFrame({
+                'row': df.index,
+                'score': df[round_name],
+                'round_index': round_number, # raw round, kept for the natural key
+                'round_number': round_number, # placeholder - rounds are numbered by date in the database
+                'player_name': df['Name'],
+                'source_file': df['source_file'] if 'source_file' in df.columns else None,
+                'source_key': row_hashes.view(np.int64), # spark's xxhash64(row_key) - signed like its LongType
+                'round_date': dates,
+            }))
+
+        df_golf = pd.concat(rounds, ignore_index=True).sort_values(['row', 'round_index'], kind='stable')
+        return df_golf.drop(columns='row').reset_index(drop=True) # return cleaned df
+
+    def clean_weather_data(self, df_weather_raw):
+        """clean raw weather data"""
+        dates = df_weather_raw['time']
+        df_weather = pd.DataFrame({
+            'date': dates,
+            'avg_temp': df_weather_raw['tavg'],
+            'precipitation': df_weather_raw['prcp'],
+            'wind_speed': df_weather_raw['wspd'],
+            'day_of_week': dates.dt.day_name(),
+            'day_of_week_int': (dates.dt.dayofweek + 1) % 7 + 1, # spark's dayofweek - sunday is 1
+        })
+        df_weather = df_weather[df_weather['date'].notna() & (df_weather['date'] >= WEATHER_START_DATE)]
+        df_weather = df_weather.drop_duplicates(subset=['date'])
+        df_weather['day_of_week_int'] = df_weather['day_of_week_int'].astype(int)
+
+        return df_weather.reset_index(drop=True) # return cleaned df
+
+    def write_table(self, df, table, row_count):
+        """COPY df into a temp table and merge it into the target in one statement
+        rows already in the target (by merge_conflict_clauses) are skipped, see _merge_staged"""
+        start = time.perf_counter()
+        columns = list(df.columns)
+        column_list = ", ".join(columns)
+
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d") # nulls become empty fields
+        buffer.seek(0)
+
+        with self.db.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    # only the loaded columns - no constraints or defaults to trip over
+                    cur.execute(f"CREATE TEMP TABLE staging_{table} ON COMMIT DROP AS "
+                                f"SELECT {column_list} FROM {table} WITH NO DATA")
+                    cur.copy_expert(f"COPY staging_{table} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+                    inserted = self._merge_staged(cur, table, f"staging_{table}", column_list)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        self._record_write(table, 'copy', row_count, time.perf_counter() - start, inserted)
+
+    def process_players(self, df_golf):
+        """process players - insert new records only and avoid duplicates"""
+        print("Processing players") # for user
+
+        # Step 1: get unique players from golf data - sorted so ids are assigned in a fixed order
+        unique_players = pd.DataFrame({'player_name': np.sort(df_golf['player_name'].dropna().unique())})
+        print(f"Found {len(unique_players)} unique players in golf data")
+
+        # Step 2: get existing players from database - read once and cached for the run
+        existing_players = self.get_dimension("players")
+        print(f"Found {len(existing_players)} existing players in database")
+
+        # newest id before inserting, so only the new rows need to be read back
+        last_player_id = int(existing_players['player_id'].max()) if len(existing_players) else 0
+
+        # Step 3: find new players - those not in players table
+        new_players = unique_players[~unique_players['player_name'].isin(existing_players['player_name'])]
+        new_player_count = len(new_players)
+
+        if new_player_count > 0:
+            print(f"Creating {new_player_count} new players")
+
+            # Step 4: insert new players into database
+            try:
+                self.write_table(new_players, "players", new_player_count)
+                print(f"Created {new_player_count} new players")
+            except Exception as e:
+                print(f"Error creating new players: {e}")
+                raise
+
+            # Step 5: add the new players and their generated ids to the cached mapping
+            inserted_players = self._read_query(
+                f"SELECT player_id, player_name FROM players WHERE player_id > {last_player_id}",
+                self.dimension_columns['players']
+            )
+            self._extend_dimension("players", inserted_players)
+        else:
+            print("All players already exist in database")
+
+        print(f"Total players in database: {self.count_table('players')}")
+
+        # return updated player mapping - all players with their IDs
+        return self.get_dimension("players")
+
+    def import_weather_to_database(self, df_weather_cleaned):
+        """import cleaned weather data to database"""
+        print("Importing weather data to database")
+
+        try:
+            # Step 1: check for existing weather dates to avoid duplicates - cached for the run
+            existing_dates = self.get_dimension("weather")
+            print(f"Found {len(existing_dates)} existing weather dates in database")
+
+            # Step 2: filter out dates that already exist
+            new_weather_data = df_weather_cleaned[~df_weather_cleaned['date'].isin(existing_dates['date'])]
+            new_records_count = len(new_weather_data)
+
+            # Step 3: import new weather data if any
+            if new_records_count > 0:
+                print(f"Importing dates")
+                self.write_table(new_weather_data, "weather", new_records_count)
+                self._extend_dimension("weather", new_weather_data)
+                print(f"Weather data imported: {new_records_count} new records")
+            else:
+                print("All weather dates already exist in database")
+
+            print(f"Total weather records in database: {self.count_table('weather')}")
+
+        except Exception as e:
+            print(f"Error importing weather data: {e}")
+            raise
+
+    def import_rounds_to_database(self, df_golf_cleaned):
+        """import cleaned rounds data - database calculates handicaps automatically"""
+        print("Processing and importing rounds data...")
+
+        try:
+            # Step 1: join rounds with player IDs
+            players_mapping = self.get_dimension("players")
+            print(f"Found {len(players_mapping)} players in database")
+            df_rounds = df_golf_cleaned.merge(players_mapping, on="player_name", how="inner")
+
+            # Step 2: keep rounds on dates with weather, and drop scores of 0 (or missing)
+            print("Verifying weather data")
+            weather_dates = self.get_dimension("weather")['date']
+            df_rounds_final = df_rounds[df_rounds['round_date'].isin(weather_dates) & (df_rounds['score'] > 0).fillna(False)]
+            df_rounds_final = df_rounds_final[["player_id", "player_name", "round_date", "score", "round_number",
+                                               "round_index", "source_file", "source_key"]]
+
+            final_count = len(df_rounds_final)
+            print(f"Rounds to import: {final_count}")
+
+            # Step 3: insert rounds - rounds already loaded are skipped by the merge, and
+            # triggers calculate handicaps and other stats for the new ones
+            if final_count > 0:
+                print("Inserting rounds")
+                self.write_table(df_rounds_final, "rounds", final_count)
+                print(f"Rounds imported: {final_count} records")
+
+        except Exception as e:
+            print(f"Error importing rounds data: {e}")
+            raise
+
+        return df_rounds_final
+
+
+if __name__ == "__main__":
+    # same run as data_processing.py without spark - each step is timed into the metrics registry
+    process = LocalProcessor()
+    with process.stage("extract"):
+        df_golf_raw, df_weather_raw = process.extract_raw_data()
+    if df_weather_raw is not None:
+        with process.stage("load_weather"):
+            process.import_weather_to_database(process.clean_weather_data(df_weather_raw))
+    if df_golf_raw is not None:
+        df_golf_cleaned = process.clean_golf_data(df_golf_raw)
+        with process.stage("load_players"):
+            process.process_players(df_golf_cleaned)
+        with process.stage("load_rounds"):
+            process.import_rounds_to_database(df_golf_cleaned)
+    process.mark_files_ingested()
+    process.clear_dimension_cache()
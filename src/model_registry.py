@@ -0,0 +1,127 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Model Registry
+    Finds versioned model artifacts in data/models and serves the newest one
+
+Artifacts are named <name>.joblib (version 0) or <name>_v<N>.joblib (version N).
+Models are loaded with mmap_mode so forked workers share the array pages, warmed
+with a dummy prediction, then swapped in atomically. Requests that already hold
+the old model finish with it
+"""
+import os
+import re
+import threading
+import time
+import joblib
+
+# data/models relative to this file, not the working directory
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "models")
+
+
+class ModelRegistry:
+    def __init__(self, name="model_GB", models_dir=MODELS_DIR, warmup=None, poll_interval=30.0):
+        self.name = name
+        self.models_dir = models_dir
+        self.warmup = warmup # function(model) run before a model goes live
+        self.poll_interval = poll_interval # seconds between checks for new versions
+        self._pattern = re.compile(rf"^{re.escape(name)}(?:_v(\d+))?\.joblib$")
+        self._lock = threading.Lock()
+        self._current = None # (version, model) - replaced as a whole, never mutated
+        self._checked_at = 0.0
+        self._loading = False
+
+    def available_versions(self):
+        """{version: path} for every artifact of this model in models_dir"""
+        versions = {}
+        for entry in os.scandir(self.models_dir):
+            match = self._pattern.match(entry.name)
+            if match and entry.is_file():
+                versions[int(match.group(1) or 0)] = entry.path
+        return versions
+
+    def _load(self, version, path):
+        """load and warm a model version"""
+        model = joblib.load(path, mmap_mode="r")
+        if self.warmup is not None:
+            self.warmup(model)
+        return version, model
+
+    def load_latest(self):
+        """load the newest version now and make it live - returns its version"""
+        versions = self.available_versions()
+        if not versions:
+            raise FileNotFoundError(f"No {self.name} artifacts found in {self.models_dir}")
+
+        latest = max(versions)
+        with self._lock:
+            if self._current is not None and self._current[0] >= latest:
+                return self._current[0]
+
+        loaded = self._load(latest, versions[latest])
+        with self._lock:
+            # another thread may have swapped in something newer meanwhile
+            if self._current is None or self._current[0] < loaded[0]:
+                self._current = loaded
+            self._checked_at = time.monotonic()
+            return self._current[0]
+
+    def _swap_in_background(self):
+        """load a newer version on a separate thread - requests keep using the current model"""
+        def load():
+            try:
+                version = self.load_latest()
+                print(f"Model {self.name} now serving version {version}")
+            except Exception as e:
+                print(f"Model {self.name} reload failed, keeping current version: {e}")
+            finally:
+                with self._lock:
+                    self._loading = False
+
+        threading.Thread(target=load, name=f"{self.name}-reload", daemon=True).start()
+
+    def get(self):
+        """current model - loaded on first use, then checked for newer versions every poll_interval"""
+        with self._lock:
+            current = self._current
+            poll_due = (current is not None and not self._loading
+                        and time.monotonic() - self._checked_at > self.poll_interval)
+            if poll_due:
+                self._checked_at = time.monotonic()
+
+        if current is None:
+            self.load_latest() # nothing to serve yet, so load on this thread
+            return self._current[1]
+
+        if poll_due and max(self.available_versions(), default=-1) > current[0]:
+            with self._lock:
+                start = not self._loading
+                self._loading = True
+            if start:
+                self._swap_in_background()
+
+        return current[1]
+
+    @property
+    def version(self):
+        """version currently being served, None before the first load"""
+        current = self._current
+        return current[0] if current is not None else None
+
+
+# one registry per model name per process, shared by every RoundBooking
+_registries = {} # name -> (registry, options it was created with)
+_registries_lock = threading.Lock()
+
+
+def get_registry(name="model_GB", **options):
+    """shared registry for a model name - options only apply when it's created, so asking
+    for the same name with different options raises instead of silently ignoring them"""
+    with _registries_lock:
+        if name not in _registries:
+            _registries[name] = (ModelRegistry(name, **options), options)
+        registry, created_with = _registries[name]
+        if options != created_with:
+            raise ValueError(f"Registry {name} already created with {created_with}, not {options}")
+        return registry
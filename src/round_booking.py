@@ -6,51 +6,126 @@ Round Booking module
     Used in Flask application
 
 Requirements
-    -ML model from 04 notebook
+    -ML model from 04 notebook in data/models (newer versions saved as model_GB_v<N>.joblib)
     -golf_analytics db created as well as tables
 """
-import joblib
+import time
+import numpy as np
 from datetime import datetime
 import pandas as pd
 from src.database import DatabaseManager
+from src.model_registry import get_registry
+from src.gb_inference import FlatGradientBoosting
+from src.metrics import registry
 from scripts import feature_engineering as fe
 
+INFERENCE_SECONDS = registry.histogram(
+    "model_inference_duration_seconds", "Time to transform features and predict one batch", ("backend",))
+INFERENCE_ROWS = registry.counter("model_inference_rows_total", "Rows scored by the model", ("backend",))
 
-class RoundBooking:
-    def __init__(self):
-        # load model and connect to db
-        self.score_model = joblib.load('../data/models/model_GB.joblib')
-        self.db = DatabaseManager()
-
-    def predict_score(self, features):
-        """use ML model to predict score"""
-        # create df from input features
-        feature_names = ['round_number', 'handicap', 'avg_temp', 'precipitation', 'wind_speed', 'day_of_week_int']
-        df = pd.DataFrame([features], columns=feature_names)
-
-        # use feature engineering function to setup features for ML
-        input_df = fe.feature_engineering(df)
-
-        # scale necessary features
-        features_to_scale = ['round_number', 'handicap', 'avg_temp', 'precipitation', 'wind_speed']
-        input_df[features_to_scale] = self.score_model['scaler'].transform(input_df[features_to_scale])
-
-        # ensure columns match training data
-        expected_columns = self.score_model['feature_names']
 
-        missing_columns = [] # fill in missing columns if needed
-        for col in expected_columns:
-            if col not in input_df.columns:
-                input_df[col] = 0
-                missing_columns.append(col)
+class TeeTimeFullError(ValueError):
+    """every spot in the requested tee time is taken"""
 
-        # reorder columns to match training
-        input_df = input_df[expected_columns]
 
-        # make score prediction for user
-        prediction = self.score_model['model'].predict(input_df)
+class RoundBooking:
+    # inference backends - "numpy" is faster for small batches, sklearn for large ones
+    inference_backends = ('sklearn', 'numpy', 'auto')
+    auto_numpy_max_rows = 256
+
+    # players per tee time when a slot is first booked (a foursome)
+    slot_capacity = 4
+
+    def __init__(self, db=None, model_name='model_GB', inference='auto'):
+        if inference not in self.inference_backends:
+            raise ValueError(f"Unknown inference backend: {inference}")
+        self.inference = inference
+        # model comes from the shared registry - loaded on first prediction, hot swapped on new versions
+        self.models = get_registry(model_name, warmup=self._warm_up)
+        # connect to db - pass db in to reuse the caller's manager
+        self.db = db if db is not None else DatabaseManager()
+
+    @property
+    def score_model(self):
+        """model currently being served (model, scaler and feature_names)"""
+        return self.models.get()
+
+    def preload(self):
+        """load the model now instead of on the first booking"""
+        return self.models.get()
+
+    @classmethod
+    def _warm_up(cls, score_model):
+        """dummy prediction through both backends so a new model is fully loaded before it goes live
+        a classmethod, so every RoundBooking hands the shared registry the same warmup"""
+        # build transformer and flatten trees before going live too
+        X = cls._transformer(score_model).transform(np.asarray([[1, 10.0, 15.0, 0.0, 5.0, 2]], dtype=float))
+        cls._compiled(score_model).predict(X)
+        score_model['model'].predict(pd.DataFrame(X, columns=score_model['feature_names']))
+
+    # raw feature layout expected by predict_score / predict_scores
+    feature_names = fe.RAW_FEATURES
 
-        return round(prediction[0]) # return predicted score
+    def predict_score(self, features):
+        """use ML model to predict score"""
+        # single booking is just a batch of one
+        return int(self.predict_scores([features])[0]) # return predicted score
+
+    def predict_scores(self, rows):
+        """predict scores for many bookings at once
+        rows can be a list of feature lists, a 2d numpy array or a DataFrame with feature_names columns"""
+        # take the model once so a hot swap mid request can't mix versions
+        return self._predict_with(self.score_model, rows)
+
+    @staticmethod
+    def _compiled(score_model):
+        """flattened numpy version of the model, built once per loaded model version"""
+        compiled = score_model.get('compiled')
+        if compiled is None:
+            compiled = FlatGradientBoosting.from_sklearn(score_model['model'])
+            score_model['compiled'] = compiled
+        return compiled
+
+    @staticmethod
+    def _transformer(score_model):
+        """fitted feature transformer for a loaded model version"""
+        transformer = score_model.get('transformer')
+        if transformer is None:
+            transformer = fe.FeatureTransformer.from_model(score_model)
+            score_model['transformer'] = transformer
+        return transformer
+
+    def _predict_with(self, score_model, rows):
+        """run the prediction pipeline with a specific model"""
+        # raw feature matrix for the whole batch
+        if isinstance(rows, pd.DataFrame):
+            raw = rows[self.feature_names].to_numpy(dtype=float)
+        else:
+            raw = np.asarray(rows, dtype=float)
+            if raw.ndim == 1: # allow a single row
+                raw = raw.reshape(1, -1)
+
+        if len(raw) == 0:
+            return np.empty(0, dtype=int)
+
+        started = time.perf_counter()
+
+        # derived features, scaling and column order in one pass - same transformer as training
+        X = self._transformer(score_model).transform(raw)
+
+        # make score predictions in a single call to the model
+        if self.inference == 'numpy' or (self.inference == 'auto' and len(X) <= self.auto_numpy_max_rows):
+            backend = 'numpy'
+            predictions = self._compiled(score_model).predict(X)
+        else:
+            backend = 'sklearn'
+            # sklearn was fitted on a DataFrame, so give it named columns
+            predictions = score_model['model'].predict(pd.DataFrame(X, columns=score_model['feature_names']))
+
+        INFERENCE_SECONDS.observe(time.perf_counter() - started, backend)
+        INFERENCE_ROWS.inc(backend, amount=len(X))
+
+        return np.rint(predictions).astype(int) # same rounding as round()
 
     def calculate_price(self, tee_time_hour, cart, features):
         """dynamic pricing function"""
@@ -81,51 +156,147 @@ class RoundBooking:
         return price # return price for user
 
 
-    def create_booking(self, name, date, tee_time_hour, cart, features):
-        """booking function - this is used by Flask application"""
+    def calculate_prices(self, tee_time_hours, carts, features):
+        """vectorized calculate_price for many tee times at once - same rules, one numpy pass"""
+        features = np.asarray(features, dtype=float)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        tee_time_hours = np.asarray(tee_time_hours)
+        carts = np.asarray(carts, dtype=bool)
+
+        round_number, handicap, avg_temp = features[:, 0], features[:, 1], features[:, 2]
+        precipitation, wind_speed, day_of_week = features[:, 3], features[:, 4], features[:, 5]
+        weekend = day_of_week >= 5
+
+        price = np.full(len(features), 75) # base price
+        price += np.where(weekend, 20, 0) # weekend surcharge
+        price += np.where(carts, 20, 0) # golf cart surcharge
+        price -= np.where((tee_time_hours > 13) & ~weekend, 15, 0) # afternoon weekday discount
+        price -= np.where((precipitation > 0.5) | (wind_speed > 15) | (avg_temp < 15), 5, 0) # bad weather
+        price -= np.where(handicap < 3, 5, 0) # better players pay a bit less
+        price += np.where(handicap > 15, 5, 0) # worse players pay a bit more
+        price -= np.where(round_number > 15, 5, 0) # loyalty bonus for members
+
+        return price
+
+    def quote_tee_sheet(self, round_number, handicap, weather, hours):
+        """price and predicted score for every date in weather (from WeatherStore.lookup_range),
+        every tee time hour, with and without a cart - one model call for the whole grid"""
+        dates = weather['date']
+        hours = np.asarray(hours)
+        n_dates, n_hours = len(dates), len(hours)
+
+        # day of week with monday = 0, same as datetime.weekday() (1970-01-01 was a thursday)
+        day_of_week = (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+
+        features = np.column_stack([
+            np.full(n_dates, round_number, dtype=float),
+            np.full(n_dates, handicap, dtype=float),
+            weather['avg_temp'],
+            weather['precipitation'],
+            weather['wind_speed'],
+            day_of_week,
+        ])
+
+        # score doesn't depend on tee time or cart, so one prediction per date
+        scores = self.predict_scores(features)
+
+        # price grid: dates x hours x (no cart, cart)
+        grid_features = np.repeat(features, n_hours * 2, axis=0)
+        grid_hours = np.tile(np.repeat(hours, 2), n_dates)
+        grid_carts = np.tile([False, True], n_dates * n_hours)
+        prices = self.calculate_prices(grid_hours, grid_carts, grid_features).reshape(n_dates, n_hours, 2)
+
+        quote = []
+        for i in range(n_dates):
+            quote.append({
+                'date': str(dates[i]),
+                'predicted_score': int(scores[i]),
+                'observed_weather': bool(weather['observed'][i]),
+                'tee_times': [
+                    {'hour': int(hours[j]), 'price': int(prices[i, j, 0]), 'price_with_cart': int(prices[i, j, 1])}
+                    for j in range(n_hours)
+                ],
+            })
+        return quote
+
+    def create_booking(self, name, date, tee_time_hour, cart, features, player_id=None):
+        """booking function - this is used by Flask application
+        pass player_id when the caller already has it to skip the lookup by name"""
         try:
             # get predictions and price
             predicted_score = self.predict_score(features)
             price = self.calculate_price(tee_time_hour, cart, features)
 
-            # check if player exists
-            player_query = "SELECT player_id FROM players WHERE player_name = %s"
-            player_result = self.db.execute_query(player_query, (name,))
+            if player_id is None:
+                # check if player exists
+                player_query = "SELECT player_id FROM players WHERE player_name = %s"
+                player_result = self.db.execute_query(player_query, (name,))
 
-            if not player_result: # if player doesn't exist
-                # name should be added to db in flask now, this is for testing here
-                raise ValueError(f"Player '{name}' not found in database")
+                if not player_result: # if player doesn't exist
+                    # name should be added to db in flask now, this is for testing here
+                    raise ValueError(f"Player '{name}' not found in database")
 
-            # get player id
-            player_id = player_result[0]['player_id']
+                # get player id
+                player_id = player_result[0]['player_id']
 
-            # create booking record in SQL
+            # reserve a spot in the tee time and create the booking in one statement
+            # the slot row is created on first booking, otherwise its booked count goes up only while under capacity.
+            # the upsert locks just that slot row, so concurrent bookings for other tee times never wait
             insert_query = """
+                        WITH reserved AS (
+                            INSERT INTO tee_time_slots (slot_time, capacity, booked)
+                            VALUES (%s, %s, 1)
+                            ON CONFLICT (slot_time) DO UPDATE
+                                SET booked = tee_time_slots.booked + 1
+                                WHERE tee_time_slots.booked < tee_time_slots.capacity
+                            RETURNING slot_time
+                        )
                         INSERT INTO bookings (player_id, tee_time, price_paid, booking_status, round_date, score_prediction, booking_time) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        SELECT %s, slot_time, %s, %s, %s, %s, %s FROM reserved
+                        RETURNING booking_id
                     """
             # generate tee time based on input hour and date
             tee_time = datetime.strptime(f"{date} {tee_time_hour}:00", "%Y-%m-%d %H:%M")
 
             # run query to insert record
-            self.db.execute_query(
+            result = self.db.execute_query(
                 insert_query,
-                (player_id, tee_time, price, 'confirmed', date, predicted_score, datetime.now())
+                (tee_time, self.slot_capacity,
+                 player_id, price, 'confirmed', date, predicted_score, datetime.now())
             )
 
-            # get booking id
-            get_booking_id = 'SELECT MAX(booking_id) FROM bookings WHERE player_id = %s'
+            if result is None:
+                raise RuntimeError("Booking insert failed")
+            if not result: # slot exists and is at capacity
+                raise TeeTimeFullError(f"The {tee_time:%H:%M} tee time on {date} is full")
 
-            booking_id = self.db.execute_query(
-                get_booking_id,
-                (player_id,)
-            )[0]['max']
+            # get booking id
+            booking_id = result[0]['booking_id']
 
             return booking_id, predicted_score, price
 
+        except TeeTimeFullError:
+            raise
         except Exception as e:
             raise Exception(f"Error creating booking: {e}")
 
+    def cancel_booking(self, booking_id):
+        """cancel a confirmed booking and give its spot back to the tee time - returns True if cancelled"""
+        cancel_query = """
+            WITH cancelled AS (
+                UPDATE bookings SET booking_status = 'cancelled'
+                WHERE booking_id = %s AND booking_status = 'confirmed'
+                RETURNING tee_time
+            )
+            UPDATE tee_time_slots s SET booked = s.booked - 1
+            FROM cancelled c
+            WHERE s.slot_time = c.tee_time
+            RETURNING s.slot_time
+        """
+        result = self.db.execute_query(cancel_query, (booking_id,))
+        return bool(result)
+
 if __name__ == "__main__":
     # test it works
     try:
@@ -0,0 +1,83 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Versioned Cache
+    Thread safe LRU of key -> (version, value) with an entry and byte budget
+
+A lookup only hits when the caller's current version matches the stored one, so
+a value goes stale as soon as whatever it was built from changes. Used for
+rendered charts (chart_cache.ChartCache), chart data and tee sheet quotes
+"""
+from collections import OrderedDict
+import threading
+
+
+class VersionedLRUCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, size_of=None):
+        # LRU of key -> (version, value, size in bytes)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._size_of = size_of or self._value_size
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _value_size(value):
+        """approximate memory used by a value - subclasses or size_of give a better estimate"""
+        return len(value) if hasattr(value, '__len__') else 0
+
+    def get(self, key, version):
+        """return the cached value if it was stored under this version, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key) # mark as recently used
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        """store a value, evicting least recently used keys if over budget"""
+        size = self._size_of(value)
+        if size > self.max_bytes: # too big to ever fit
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+    def invalidate(self, key=None):
+        """drop one key, or everything if no key given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+    def stats(self):
+        """cache size and hit rate"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,142 @@
+"""
+Author: Thomas Kulch
+DS5110 - Final Project - Golf Course Manager
+
+Weather Store
+    In memory copy of the weather table used by booking, pricing and prediction
+
+Weather is loaded once into date indexed numpy arrays. Dates that are missing
+(or have missing values) fall back to the average for that calendar month.
+The store checks the table for changes every max_age seconds, or can be
+refreshed directly after the ETL loads new weather
+"""
+import threading
+import time
+import numpy as np
+
+
+class WeatherStore:
+    fields = ('avg_temp', 'precipitation', 'wind_speed')
+
+    def __init__(self, db, max_age=300.0):
+        self.db = db
+        self.max_age = max_age # seconds between checks for new weather rows
+        self._lock = threading.Lock()
+        self._snapshot = None # (version, dates, values, monthly_means)
+        self._checked_at = 0.0
+        self._listeners = [] # called after every reload
+
+    def on_refresh(self, callback):
+        """register a function to call when weather data is reloaded"""
+        self._listeners.append(callback)
+
+    def _table_version(self):
+        """cheap check for changes to the weather table"""
+        result = self.db.execute_query("SELECT COUNT(*) AS row_count, MAX(date) AS last_date FROM weather")
+        if not result:
+            return None
+        return result[0]['row_count'], result[0]['last_date']
+
+    def refresh(self):
+        """reload all weather rows from the database"""
+        version = self._table_version()
+        rows = self.db.execute_query(
+            "SELECT date, avg_temp, precipitation, wind_speed FROM weather ORDER BY date"
+        )
+        if rows is None: # db unavailable - keep serving what we have
+            return False
+
+        dates = np.array([row['date'] for row in rows], dtype='datetime64[D]')
+        values = np.array(
+            [[np.nan if row[field] is None else row[field] for field in self.fields] for row in rows],
+            dtype=float
+        ).reshape(len(rows), len(self.fields))
+
+        # fallback values - per calendar month, then overall when a month has no data
+        months = dates.astype('datetime64[M]').astype(int) % 12 if len(rows) else np.empty(0, dtype=int)
+        overall = np.array([np.nanmean(values[:, i]) if np.isfinite(values[:, i]).any() else 0.0
+                            for i in range(len(self.fields))])
+        monthly_means = np.tile(overall, (12, 1))
+        for month in range(12):
+            in_month = values[months == month]
+            for i in range(len(self.fields)):
+                column = in_month[:, i]
+                if np.isfinite(column).any():
+                    monthly_means[month, i] = np.nanmean(column)
+
+        with self._lock:
+            self._snapshot = (version, dates, values, monthly_means)
+            self._checked_at = time.monotonic()
+
+        for callback in self._listeners:
+            callback()
+        return True
+
+    @property
+    def loaded(self):
+        """True once weather rows are held in memory"""
+        return self._snapshot is not None
+
+    def invalidate(self):
+        """force a reload on next lookup - call after the ETL loads new weather"""
+        with self._lock:
+            self._snapshot = None
+
+    def _current(self):
+        """current snapshot, reloading if it's missing or the table changed"""
+        with self._lock:
+            snapshot = self._snapshot
+            stale = snapshot is None or time.monotonic() - self._checked_at > self.max_age
+            if snapshot is not None and stale:
+                self._checked_at = time.monotonic() # only one thread does the version check
+
+        if snapshot is not None and stale and self._table_version() != snapshot[0]:
+            snapshot = None
+
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+
+        if snapshot is None:
+            raise RuntimeError("Weather data unavailable")
+        return snapshot
+
+    def _lookup_many(self, dates):
+        """values for an array of dates, with monthly fallback for gaps
+        returns (values, observed) - observed is True only where the stored row had every value"""
+        _, known_dates, values, monthly_means = self._current()
+
+        positions = np.searchsorted(known_dates, dates)
+        positions = np.minimum(positions, max(len(known_dates) - 1, 0))
+        if len(known_dates):
+            found = known_dates[positions] == dates
+        else:
+            found = np.zeros(len(dates), dtype=bool)
+
+        months = dates.astype('datetime64[M]').astype(int) % 12
+        result = monthly_means[months].copy()
+        observed = found.copy()
+        if found.any():
+            stored = values[positions[found]]
+            complete = np.isfinite(stored).all(axis=1)
+            result[found] = np.where(np.isfinite(stored), stored, result[found])
+            observed[found] = complete # partly filled from the monthly fallback isn't observed
+
+        return result, observed
+
+    def lookup(self, date):
+        """weather features for a single date (str 'YYYY-MM-DD' or date)"""
+        result, observed = self._lookup_many(np.array([date], dtype='datetime64[D]'))
+        weather = {field: float(result[0, i]) for i, field in enumerate(self.fields)}
+        weather['observed'] = bool(observed[0]) # False when any value came from the monthly fallback
+        return weather
+
+    def lookup_range(self, start_date, end_date):
+        """weather features for every day from start_date to end_date inclusive, as arrays"""
+        dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+        result, observed = self._lookup_many(dates)
+
+        weather = {field: result[:, i] for i, field in enumerate(self.fields)}
+        weather['date'] = dates
+        weather['observed'] = observed
+        return weather